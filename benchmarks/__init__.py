@@ -0,0 +1,4 @@
+"""Performance benchmarks for pymalcolm.
+
+Run with ``python -m benchmarks.runner --help`` from the top of the checkout.
+"""
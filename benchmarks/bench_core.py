@@ -0,0 +1,170 @@
+"""Benchmarks for malcolm.core"""
+from annotypes import Anno, Array
+
+from malcolm.core import Process, Controller, Context, Queue, Get, \
+    Subscribe, TableMeta, Table, serialize_object, \
+    deserialize_object
+from malcolm.modules.builtin.parts import Float64Part
+from malcolm.modules.demo.parts import CounterPart
+
+from benchmarks.util import benchmark
+
+with Anno("Names"):
+    ANames = Array[str]
+with Anno("Values"):
+    AValues = Array[float]
+
+
+class BenchTable(Table):
+    def __init__(self, name, value):
+        # type: (ANames, AValues) -> None
+        self.name = ANames(name)
+        self.value = AValues(value)
+
+
+def make_process(n_attributes=1):
+    """Make a started Process with a single Block called "bench" that has a
+    counter Attribute, increment() Method and n_attributes float Attributes
+    """
+    process = Process("bench_proc")
+    controller = Controller("bench")
+    controller.add_part(CounterPart("counter"))
+    for i in range(n_attributes):
+        controller.add_part(Float64Part(
+            "attr%d" % i, "Attribute %d" % i, writeable=True))
+    process.add_controller(controller)
+    process.start()
+    return process, controller
+
+
+@benchmark("notifier_fanout", subscribers=[1, 10, 100])
+def notifier_fanout(subscribers):
+    process, controller = make_process()
+    q = Queue()
+    for i in range(subscribers):
+        request = Subscribe(i, ["bench", "counter", "value"])
+        request.set_callback(q.put)
+        controller.handle_request(request).wait()
+        q.get(timeout=1)
+    part = controller.parts["counter"]
+    values = [0]
+
+    def set_value():
+        values[0] += 1
+        part.counter.set_value(values[0])
+        for _ in range(subscribers):
+            q.get(timeout=1)
+
+    yield set_value
+    process.stop(timeout=1)
+
+
+@benchmark("serialize_object", attributes=[10, 200])
+def serialize_block(attributes):
+    process, controller = make_process(attributes)
+    block = controller._block
+
+    def serialize():
+        serialize_object(block)
+
+    yield serialize
+    process.stop(timeout=1)
+
+
+@benchmark("deserialize_object", attributes=[10, 200])
+def deserialize_block(attributes):
+    process, controller = make_process(attributes)
+    serialized = serialize_object(controller._block)
+
+    def deserialize():
+        # Clients deserialize each field of the Block separately
+        for k, v in serialized.items():
+            if k != "typeid":
+                deserialize_object(v)
+
+    yield deserialize
+    process.stop(timeout=1)
+
+
+@benchmark("context_put")
+def context_put():
+    process, controller = make_process()
+    context = Context(process)
+    values = [0]
+
+    def put():
+        values[0] += 1
+        context.put(["bench", "attr0", "value"], values[0])
+
+    yield put
+    process.stop(timeout=1)
+
+
+@benchmark("context_post")
+def context_post():
+    process, controller = make_process()
+    context = Context(process)
+
+    def post():
+        context.post(["bench", "increment"])
+
+    yield post
+    process.stop(timeout=1)
+
+
+@benchmark("context_subscribe")
+def context_subscribe():
+    process, controller = make_process()
+    context = Context(process)
+
+    def subscribe():
+        # Subscribe, wait for the first update, then unsubscribe
+        context.when_matches(["bench", "counter", "value"], 0)
+
+    yield subscribe
+    process.stop(timeout=1)
+
+
+@benchmark("handle_request", ops=100)
+def handle_request():
+    process, controller = make_process()
+    q = Queue()
+    requests = []
+    for i in range(100):
+        request = Get(i, ["bench", "counter", "value"])
+        request.set_callback(q.put)
+        requests.append(request)
+
+    def handle():
+        for request in requests:
+            controller.handle_request(request)
+        for _ in requests:
+            q.get(timeout=1)
+
+    yield handle
+    process.stop(timeout=1)
+
+
+@benchmark("table_validate", rows=[10, 1000])
+def table_validate(rows):
+    meta = TableMeta.from_table(BenchTable, "Benchmark table")
+    value = dict(
+        name=["row%d" % i for i in range(rows)],
+        value=[float(i) for i in range(rows)])
+
+    def validate():
+        meta.validate(value)
+
+    yield validate
+
+
+@benchmark("make_view", attributes=[10, 200])
+def make_view(attributes):
+    process, controller = make_process(attributes)
+    context = Context(process)
+
+    def view():
+        controller.make_view(context)
+
+    yield view
+    process.stop(timeout=1)
@@ -0,0 +1,319 @@
+"""End to end load generator for the websocket and pvAccess servers.
+
+Starts a server Process in a subprocess with N Blocks of M float64 Attributes
+that are all updated at a given rate, published through
+``WebsocketServerPart`` and ``PvaServerComms``. K websocket and K pvAccess
+clients are then attached from this process, and the update latency,
+coalesced and dropped updates, and the CPU used by the server are reported::
+
+    python -m benchmarks.loadgen --blocks 10 --attributes 20 --rate 10 \\
+        --ws-clients 4 --pva-clients 4 --duration 10
+
+Each Attribute value is a sequence number incremented on every update, and
+its timeStamp is when the update was made, so the clients can work out how
+many updates were skipped and how long the others took to arrive.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.websocket import websocket_connect
+
+from malcolm.compat import OrderedDict
+
+# Map backend name to the value of PYMALCOLM_USE_COTHREAD that selects it
+BACKENDS = OrderedDict([("cothread", "YES"), ("thread", "NO")])
+
+# Arguments passed through to the server subprocess
+SERVER_ARGS = ["blocks", "attributes", "rate", "duration", "warmup", "drain",
+               "port"]
+
+
+def load_block(mri, attributes):
+    """Make a Block based on the demo counter_block, but with a number of
+    float64 Attributes instead of the counter"""
+    from malcolm.modules.builtin.controllers import BasicController
+    from malcolm.modules.builtin.parts import Float64Part
+    controller = BasicController(mri, "Load generator block")
+    for i in range(attributes):
+        controller.add_part(Float64Part("attr%d" % i, "Attribute %d" % i))
+    return controller
+
+
+def run_server(args):
+    """Serve the load Blocks, update them for args.duration seconds, then
+    print a JSON line of statistics to stdout"""
+    from malcolm.compat import sleep
+    from malcolm.core import Process
+    from malcolm.modules.pva.blocks import pva_server_block
+    from malcolm.modules.web.blocks import web_server_block
+    process = Process("LoadServer")
+    controllers = [load_block("LOAD:%d" % i, args.attributes)
+                   for i in range(args.blocks)]
+    controllers += web_server_block(mri="LOAD:WEB", port=args.port)
+    controllers += pva_server_block(mri="LOAD:PVA")
+    process.add_controllers(controllers)
+    process.start()
+    print("READY")
+    sys.stdout.flush()
+    # Give the clients time to connect
+    sleep(args.warmup)
+    attrs = [[part.attr for part in c.parts.values()]
+             for c in controllers[:args.blocks]]
+    period = 1.0 / args.rate
+    ticks = int(args.duration * args.rate)
+    late_ticks = 0
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+    for seq in range(1, ticks + 1):
+        for controller, block_attrs in zip(controllers, attrs):
+            with controller.changes_squashed:
+                for attr in block_attrs:
+                    attr.set_value(seq)
+        delay = start + seq * period - time.time()
+        if delay > 0:
+            sleep(delay)
+        else:
+            late_ticks += 1
+    elapsed = time.time() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    # Let the clients catch up before we disconnect them
+    sleep(args.drain)
+    process.stop(timeout=1)
+    cpu = (end_usage.ru_utime - start_usage.ru_utime +
+           end_usage.ru_stime - start_usage.ru_stime)
+    stats = OrderedDict()
+    stats["ticks"] = ticks
+    stats["late_ticks"] = late_ticks
+    stats["elapsed"] = elapsed
+    stats["cpu_seconds"] = cpu
+    stats["cpu_percent"] = 100 * cpu / elapsed
+    print(json.dumps(stats))
+    sys.stdout.flush()
+
+
+class ClientStats(object):
+    """Statistics collected by a single client connection"""
+    def __init__(self, name):
+        self.name = name
+        # {(mri, attr): last seen sequence number}
+        self.last_seq = {}
+        self.latencies = []
+        self.received = 0
+        self.coalesced = 0
+
+    def update(self, key, seq, ts):
+        now = time.time()
+        seq = int(seq)
+        last = self.last_seq.get(key)
+        self.last_seq[key] = seq
+        # The first update is the initial value on subscribe, so don't count it
+        if last is not None and seq > last:
+            self.received += 1
+            self.coalesced += seq - last - 1
+            self.latencies.append(now - ts)
+
+
+class WebsocketLoadClient(object):
+    """Subscribe to deltas of each load Block over a websocket"""
+    def __init__(self, name, port, mris):
+        self.stats = ClientStats(name)
+        self.port = port
+        self.mris = mris
+
+    def start(self, loop):
+        loop.add_callback(self.run)
+
+    def close(self):
+        pass
+
+    @gen.coroutine
+    def run(self):
+        url = "ws://localhost:%d/ws" % self.port
+        conn = yield websocket_connect(url)
+        for i, mri in enumerate(self.mris):
+            conn.write_message(json.dumps(dict(
+                typeid="malcolm:core/Subscribe:1.0", id=i, path=[mri],
+                delta=True)))
+        while True:
+            message = yield conn.read_message()
+            if message is None:
+                break
+            self.on_message(message)
+
+    def on_message(self, message):
+        d = json.loads(message)
+        mri = self.mris[d["id"]]
+        values = {}
+        for change in d.get("changes", []):
+            path = change[0]
+            if not path:
+                # Initial value of the whole Block
+                for k, v in change[1].items():
+                    if k.startswith("attr"):
+                        values[k] = v
+            elif len(path) == 2 and path[0].startswith("attr"):
+                values.setdefault(path[0], {})[path[1]] = change[1]
+        for attr, v in values.items():
+            ts = v["timeStamp"]
+            self.stats.update((mri, attr), v["value"],
+                              ts["secondsPastEpoch"] + 1e-9 * ts["nanoseconds"])
+
+
+class PvaLoadClient(object):
+    """Monitor each load Block over pvAccess"""
+    def __init__(self, name, mris):
+        self.stats = ClientStats(name)
+        self.mris = mris
+        self.ctxt = None
+        self.subscriptions = []
+
+    def start(self, loop):
+        from p4p.client.thread import Context
+        self.ctxt = Context("pva", unwrap=False)
+        for mri in self.mris:
+            self.subscriptions.append(self.ctxt.monitor(
+                mri, lambda value, mri=mri: self.on_update(mri, value)))
+
+    def close(self):
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.ctxt.close()
+
+    def on_update(self, mri, value):
+        if isinstance(value, Exception):
+            return
+        attrs = set(f.split(".")[0] for f in value.changedSet()
+                    if f.startswith("attr"))
+        for attr in attrs:
+            ts = value[attr].timeStamp
+            self.stats.update((mri, attr), value[attr].value,
+                              ts.secondsPastEpoch + 1e-9 * ts.nanoseconds)
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return float("nan")
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarise(clients, ticks):
+    """Merge client statistics by transport"""
+    summary = OrderedDict()
+    for client in clients:
+        stats = client.stats
+        transport = summary.setdefault(stats.name, OrderedDict([
+            ("clients", 0), ("received", 0), ("coalesced", 0), ("dropped", 0),
+            ("latencies", [])]))
+        transport["clients"] += 1
+        transport["received"] += stats.received
+        transport["coalesced"] += stats.coalesced
+        # Anything that didn't arrive by the end was dropped
+        transport["dropped"] += sum(ticks - seq
+                                    for seq in stats.last_seq.values())
+        transport["latencies"] += stats.latencies
+    for transport in summary.values():
+        latencies = sorted(transport.pop("latencies"))
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99),
+                               ("max", 1.0)):
+            transport["latency_%s_ms" % name] = \
+                1000 * percentile(latencies, fraction)
+    return summary
+
+
+def read_line(server, prefix):
+    """Return the next line from the server that starts with prefix"""
+    for line in iter(server.stdout.readline, b""):
+        if line.startswith(prefix):
+            return line
+
+
+def run(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYMALCOLM_USE_COTHREAD"] = BACKENDS[args.backend]
+    env["PYTHONPATH"] = os.pathsep.join(
+        [root] + [p for p in [env.get("PYTHONPATH")] if p])
+    cmd = [sys.executable, "-m", "benchmarks.loadgen", "--server"]
+    for name in SERVER_ARGS:
+        cmd += ["--%s" % name, str(getattr(args, name))]
+    server = subprocess.Popen(cmd, env=env, cwd=root, stdout=subprocess.PIPE)
+    # pvAccess may log to stdout, so skip lines until we see the ones we want
+    assert read_line(server, b"READY"), "Server failed to start"
+    mris = ["LOAD:%d" % i for i in range(args.blocks)]
+    clients = [WebsocketLoadClient("websocket", args.port, mris)
+               for _ in range(args.ws_clients)]
+    clients += [PvaLoadClient("pva", mris)
+                for _ in range(args.pva_clients)]
+    loop = IOLoop()
+    thread = threading.Thread(target=loop.start)
+    thread.daemon = True
+    thread.start()
+    for client in clients:
+        client.start(loop)
+    # Server sends its stats when it has finished updating and draining
+    server_stats = json.loads(
+        read_line(server, b"{").decode(), object_pairs_hook=OrderedDict)
+    server.wait()
+    loop.add_callback(loop.stop)
+    for client in clients:
+        client.close()
+    results = OrderedDict()
+    results["config"] = OrderedDict(
+        (k, getattr(args, k)) for k in (
+            "backend", "blocks", "attributes", "rate", "ws_clients",
+            "pva_clients", "duration"))
+    results["server"] = server_stats
+    results["clients"] = summarise(clients, server_stats["ticks"])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--blocks", type=int, default=10,
+                        help="Number of Blocks to serve")
+    parser.add_argument("--attributes", type=int, default=10,
+                        help="Number of Attributes in each Block")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="Number of times per second to update every "
+                             "Attribute")
+    parser.add_argument("--ws-clients", type=int, default=1,
+                        help="Number of websocket client connections")
+    parser.add_argument("--pva-clients", type=int, default=1,
+                        help="Number of pvAccess client connections")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Number of seconds to update for")
+    parser.add_argument("--warmup", type=float, default=3.0,
+                        help="Time to wait for clients to connect")
+    parser.add_argument("--drain", type=float, default=1.0,
+                        help="Time to wait for clients to catch up")
+    parser.add_argument("--port", type=int, default=8008,
+                        help="Port for the websocket server")
+    parser.add_argument("--backend", choices=list(BACKENDS),
+                        default="cothread")
+    parser.add_argument("--output", help="File to write JSON results to")
+    parser.add_argument("--server", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.server:
+        run_server(args)
+        return
+    results = run(args)
+    print(json.dumps(results, indent=2, separators=(",", ": ")))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, separators=(",", ": "))
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
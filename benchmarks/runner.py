@@ -0,0 +1,158 @@
+"""Run the registered benchmarks and compare the results with a baseline.
+
+Each backend is run in its own subprocess, as ``PYMALCOLM_USE_COTHREAD`` has
+to be set before malcolm is imported::
+
+    python -m benchmarks.runner run --output results.json
+    python -m benchmarks.runner compare benchmarks/baseline.json results.json
+
+``compare`` exits with a non-zero status if any benchmark has regressed by
+more than the given threshold.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from malcolm.compat import OrderedDict
+
+from benchmarks.util import registry, time_benchmark
+
+# Map backend name to the value of PYMALCOLM_USE_COTHREAD that selects it
+BACKENDS = OrderedDict([("cothread", "YES"), ("thread", "NO")])
+
+# Where the stored baseline lives
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Modules that register benchmarks when imported
+BENCHMARK_MODULES = ["benchmarks.bench_core"]
+
+
+def run_in_process(args):
+    """Run benchmarks with the backend selected by the environment"""
+    from malcolm.compat import maybe_import_cothread
+    for module in BENCHMARK_MODULES:
+        __import__(module)
+    results = OrderedDict()
+    if args.backend == "cothread" and maybe_import_cothread() is None:
+        results["skipped"] = "cothread not available"
+    else:
+        for name, (manager, kwargs, ops) in registry.items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = time_benchmark(
+                manager, kwargs, ops, args.repeats, args.min_time)
+            print("%-50s %12.3fus" % (name, results[name]["median"] * 1e6),
+                  file=sys.stderr)
+    json.dump(results, sys.stdout)
+
+
+def run(args):
+    """Run benchmarks for each backend in a subprocess and save the results"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = OrderedDict()
+    output["meta"] = OrderedDict([
+        ("python", platform.python_version()),
+        ("platform", platform.platform()),
+        ("time", time.strftime("%Y-%m-%dT%H:%M:%S"))])
+    output["results"] = OrderedDict()
+    backends = list(BACKENDS) if args.backend == "both" else [args.backend]
+    for backend in backends:
+        print("Running %s benchmarks" % backend, file=sys.stderr)
+        env = dict(os.environ)
+        env["PYMALCOLM_USE_COTHREAD"] = BACKENDS[backend]
+        env["PYTHONPATH"] = os.pathsep.join(
+            [root] + [p for p in [env.get("PYTHONPATH")] if p])
+        cmd = [sys.executable, "-m", "benchmarks.runner", "_run_backend",
+               "--backend", backend, "--repeats", str(args.repeats),
+               "--min-time", str(args.min_time)]
+        if args.filter:
+            cmd += ["--filter", args.filter]
+        stdout = subprocess.check_output(cmd, env=env, cwd=root)
+        output["results"][backend] = json.loads(
+            stdout.decode(), object_pairs_hook=OrderedDict)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2, separators=(",", ": "))
+        f.write("\n")
+    print("Results written to %s" % args.output, file=sys.stderr)
+
+
+def compare_results(baseline, current, threshold):
+    """Compare two sets of results
+
+    Returns:
+        list: [(backend, name, baseline_median, current_median, ratio)] for
+            every benchmark that exists in both
+        list: The subset of the above where ratio > 1 + threshold
+    """
+    rows, regressions = [], []
+    for backend, results in current["results"].items():
+        base_results = baseline["results"].get(backend, {})
+        for name, result in results.items():
+            base = base_results.get(name)
+            if not isinstance(base, dict) or not isinstance(result, dict):
+                # Either skipped or a new benchmark
+                continue
+            ratio = result["median"] / base["median"]
+            row = (backend, name, base["median"], result["median"], ratio)
+            rows.append(row)
+            if ratio > 1 + threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def compare(args):
+    """Print a comparison table and return non-zero if anything regressed"""
+    with open(args.baseline) as f:
+        baseline = json.load(f, object_pairs_hook=OrderedDict)
+    with open(args.current) as f:
+        current = json.load(f, object_pairs_hook=OrderedDict)
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSED" if row in regressions else ""
+        print("%-9s %-50s %10.3fus %10.3fus %6.2fx %s" % (
+            row[0], row[1], row[2] * 1e6, row[3] * 1e6, row[4], flag))
+    if regressions:
+        print("%d benchmark(s) regressed by more than %d%%" % (
+            len(regressions), args.threshold * 100))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command")
+    for name in ("run", "_run_backend"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument(
+            "--backend", choices=list(BACKENDS) + ["both"], default="both")
+        sub.add_argument("--repeats", type=int, default=5,
+                         help="Number of timed repeats of each benchmark")
+        sub.add_argument("--min-time", type=float, default=0.1,
+                         help="Minimum time in seconds for each repeat")
+        sub.add_argument("--filter", help="Only run benchmarks with names "
+                                          "containing this string")
+        if name == "run":
+            sub.add_argument("--output", default="benchmark_results.json",
+                             help="File to write JSON results to")
+    sub = subparsers.add_parser("compare")
+    sub.add_argument("baseline", nargs="?", default=BASELINE)
+    sub.add_argument("current", nargs="?", default="benchmark_results.json")
+    sub.add_argument("--threshold", type=float, default=0.25,
+                     help="Fractional slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+    elif args.command == "_run_backend":
+        run_in_process(args)
+    else:
+        return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
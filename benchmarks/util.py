@@ -0,0 +1,62 @@
+"""Registration and timing of benchmarks"""
+import contextlib
+import timeit
+
+from malcolm.compat import OrderedDict
+
+# name -> (func, kwargs, ops)
+registry = OrderedDict()
+
+
+def benchmark(name, ops=1, **params):
+    """Register a benchmark.
+
+    The decorated function is turned into a context manager that does any
+    setup, yields the zero argument callable to be timed, then tears down.
+    If keyword arguments are given then they should be lists of values, and
+    the benchmark will be registered once for each value, with the value
+    passed to the decorated function. ``ops`` is the number of operations
+    each call of the yielded callable performs.
+
+    Args:
+        name (str): The name of the benchmark
+        ops (int): Number of operations done by each call of the callable
+        **params: Single keyword argument mapping to a list of values
+    """
+    assert len(params) < 2, "Can only parametrize on one argument"
+
+    def decorator(func):
+        manager = contextlib.contextmanager(func)
+        if params:
+            (param, values), = params.items()
+            for value in values:
+                key = "%s[%s=%s]" % (name, param, value)
+                registry[key] = (manager, {param: value}, ops)
+        else:
+            registry[name] = (manager, {}, ops)
+        return func
+    return decorator
+
+
+def time_benchmark(manager, kwargs, ops, repeats, min_time):
+    # type: (...) -> OrderedDict
+    """Time a single benchmark, returning per operation timings in seconds"""
+    with manager(**kwargs) as func:
+        # Calibrate the number of loops so each repeat takes at least min_time
+        loops = 1
+        while True:
+            elapsed = timeit.Timer(func).timeit(loops)
+            if elapsed >= min_time:
+                break
+            loops *= 10 if elapsed < min_time / 10 else 2
+        timer = timeit.Timer(func)
+        per_op = sorted(
+            timer.timeit(loops) / (loops * ops) for _ in range(repeats))
+    result = OrderedDict()
+    result["min"] = per_op[0]
+    result["median"] = per_op[len(per_op) // 2]
+    result["max"] = per_op[-1]
+    result["loops"] = loops
+    result["ops"] = ops
+    result["repeats"] = repeats
+    return result
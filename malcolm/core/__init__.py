@@ -20,7 +20,8 @@ from .process import Process, ProcessPublishHook, ProcessStartHook, \
     ProcessStopHook, APublished, UnpublishedInfo, UUnpublishedInfos
 from .queue import Queue
 from .request import Request, PathRequest, Subscribe, Unsubscribe, Get, Put, Post
-from .response import Response, Delta, Update, Return, Error
+from .response import Response, Delta, Update, Return, Error, \
+    apply_changes
 from .serializable import Serializable, deserialize_object, serialize_object, \
     json_decode, json_encode, snake_to_camel, camel_to_title, \
     CAMEL_RE, serialize_hook, stringify_error
@@ -64,6 +64,12 @@ class Controller(Hookable):
         self.info_registry.set_spawn(self.spawn)
         self.add_initial_part_fields()
 
+    def get_start_dependencies(self):
+        # type: () -> List[str]
+        """Return the mris of Controllers that should finish starting before
+        this one is started by the Process"""
+        return []
+
     def add_part(self, part):
         # type: (Part) -> None
         assert part.name not in self.parts, \
@@ -205,6 +211,20 @@ class Controller(Hookable):
         ret = [request.return_response(serialized)]
         return ret
 
+    def get_generation(self, path):
+        # type: (List[str]) -> int
+        """Get the change generation of the deepest Model along path. This
+        will be different whenever anything at or below path has changed.
+        Doesn't take the lock, so may be stale, but never older than the
+        data that a subsequent Get would return"""
+        data = self._block
+        generation = data.generation
+        for endpoint in path[1:]:
+            data = data[endpoint]
+            if isinstance(data, Model):
+                generation = data.generation
+        return generation
+
     def check_field_writeable(self, field):
         if isinstance(field, AttributeModel):
             if not field.meta.writeable:
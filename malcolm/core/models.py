@@ -27,6 +27,8 @@ def check_type(value, typ):
 class Model(Serializable):
     notifier = DummyNotifier()
     path = []
+    # Increased by the Notifier whenever this Model or its children change
+    generation = 0
     __slots__ = []
 
     def set_notifier_path(self, notifier, path):
@@ -56,6 +58,23 @@ class Model(Serializable):
                 child = getattr(self, name)
                 child.set_notifier_path(notifier, self.path + [name])
 
+    def set_generation(self, generation):
+        # type: (int) -> None
+        """Sets the change generation of this Model and all its children
+
+        Args:
+            generation (int): The Notifier generation when they changed
+        """
+        self.generation = generation
+        for name, ct in self.call_types.items():
+            if ct.is_mapping:
+                child = getattr(self, name)
+                if issubclass(ct.typ[1], Model) and child:
+                    for v in child.values():
+                        v.set_generation(generation)
+            elif issubclass(ct.typ, Model):
+                getattr(self, name).set_generation(generation)
+
     def set_endpoint_data(self, name, value):
         # type: (str_, Any) -> Any
         try:
@@ -1,3 +1,4 @@
+import time
 from contextlib import contextmanager
 
 from annotypes import TYPE_CHECKING
@@ -34,6 +35,10 @@ class Notifier(Loggable):
         # type: (str, RLock, BlockModel) -> None
         self.set_logger(mri=mri)
         self._tree = NotifierNode(block)
+        self._block = block
+        # Incremented on every change, starting from the current time so that
+        # generations are not reused if the process is restarted
+        self._generation = int(time.time() * 1e6)
         self._lock = lock
         # Incremented every time we do with changes_squashed
         self._squashed_count = 0
@@ -75,12 +80,28 @@ class Notifier(Loggable):
             data (object): The new data, None for deletion
         """
         assert self._squashed_count, "Called while not squashing changes"
+        self._set_generations(path, data)
         if data is None:
             change = [path[1:]]
         else:
             change = [path[1:], data]
         self._squashed_changes.append(change)
 
+    def _set_generations(self, path, data):
+        # type: (List[str], Any) -> None
+        """Bump the generation of every Model from the Block down to data"""
+        self._generation += 1
+        node = self._block
+        node.generation = self._generation
+        for endpoint in path[1:-1]:
+            if not hasattr(node, "__getitem__"):
+                break
+            node = node[endpoint]
+            if hasattr(node, "set_generation"):
+                node.generation = self._generation
+        if hasattr(data, "set_generation"):
+            data.set_generation(self._generation)
+
     def __enter__(self):
         """So we can use this as a context manager for squashing changes"""
         self._lock.acquire()
@@ -1,3 +1,4 @@
+import time
 from multiprocessing.pool import ThreadPool
 
 from annotypes import Anno, Array, TYPE_CHECKING, Union, Sequence
@@ -10,6 +11,7 @@ from .errors import WrongThreadError
 from .hook import Hook, start_hooks, AHookable, wait_hooks
 from .info import Info
 from .loggable import Loggable
+from .queue import Queue
 from .rlock import RLock
 from .spawned import Spawned
 from .views import Block
@@ -82,6 +84,8 @@ class Process(Loggable):
         self._spawn_count = 0
         self._thread_pool = None
         self._lock = RLock()
+        # {mri: seconds} how long each controller took to run ProcessStartHook
+        self.start_durations = OrderedDict()  # type: Dict[str, float]
 
     def start(self, timeout=None):
         """Start the process going
@@ -101,8 +105,7 @@ class Process(Loggable):
     def _start_controllers(self, controller_list, timeout=None):
         # type: (List[Controller], float) -> bool
         # Start just the given controller_list
-        infos = self._run_hook(ProcessStartHook, controller_list,
-                               timeout=timeout, user_facing=True)
+        infos = self._run_start_hooks(controller_list, timeout)
         new_unpublished = set(
             info.mri for info in UnpublishedInfo.filter_values(infos))
         with self._lock:
@@ -112,6 +115,73 @@ class Process(Loggable):
         else:
             return False
 
+    def _run_start_hooks(self, controller_list, timeout=None):
+        # type: (List[Controller], float) -> Dict[str, Any]
+        # Run ProcessStartHook on the given controllers, only starting each
+        # one when the controllers it depends on have finished starting.
+        # Controllers that don't depend on each other start concurrently
+        controllers = OrderedDict((c.mri, c) for c in controller_list)
+        # {mri: set(mri)} of the dependencies within controller_list
+        pending = OrderedDict()
+        for mri, controller in controllers.items():
+            pending[mri] = set(
+                dep for dep in controller.get_start_dependencies()
+                if dep in controllers and dep != mri)
+        hook_queue = Queue(user_facing=True)
+        # {Hook: start_time}
+        running = {}
+        return_dict = OrderedDict((c.name, None) for c in controller_list)
+        start = time.time()
+
+        def start_ready():
+            while True:
+                ready = [mri for mri, deps in pending.items() if not deps]
+                if not ready and not running and pending:
+                    # Circular dependency, so start everything left and let
+                    # the controllers sort it out between themselves
+                    self.log.warning(
+                        "Circular start dependencies between %s",
+                        list(pending))
+                    ready = list(pending)
+                if not ready:
+                    return
+                for mri in ready:
+                    pending.pop(mri)
+                    controller = controllers[mri]
+                    hook = ProcessStartHook(controller).set_spawn(
+                        controller.spawn).set_queue(hook_queue)
+                    controller.on_hook(hook)
+                    if hook.spawned:
+                        running[hook] = time.time()
+                    else:
+                        # Nothing hooked, so it has started already
+                        finished(mri)
+
+        def finished(mri):
+            for deps in pending.values():
+                deps.discard(mri)
+
+        start_ready()
+        while running:
+            hook, ret = hook_queue.get()  # type: Tuple[Hook, Any]
+            hook.spawned.wait(timeout)
+            mri = hook.child.mri
+            duration = time.time() - running.pop(hook)
+            self.start_durations[mri] = duration
+            self.log.info("%s started in %.3fs", mri, duration)
+            if isinstance(ret, Exception):
+                # Errors are logged by the hook, but don't stop dependent
+                # controllers starting
+                self.log.warning("%s failed to start: %s", mri, ret)
+            else:
+                return_dict[hook.child.name] = ret
+            finished(mri)
+            start_ready()
+        self.log.debug(
+            "Started %d controllers in %.3fs", len(controllers),
+            time.time() - start)
+        return return_dict
+
     def _publish_controllers(self, timeout):
         # New controllers to publish
         published = [mri for mri in self._controllers
@@ -213,18 +283,34 @@ class Process(Loggable):
             timeout (float): Maximum amount of time to wait for each spawned
                 object. None means forever
         """
+        self.add_controllers([controller], timeout)
+
+    def add_controllers(self, controllers, timeout=None):
+        # type: (Sequence[Controller], float) -> None
+        """Add a number of controllers to be hosted by this process. If the
+        process is already started they will be started together, then
+        published in a single pass
+
+        Args:
+            controllers (list): The controllers to add
+            timeout (float): Maximum amount of time to wait for each spawned
+                object. None means forever
+        """
         self._call_in_right_thread(
-            self._add_controller, controller, timeout)
+            self._add_controllers, list(controllers), timeout)
 
-    def _add_controller(self, controller, timeout):
-        # type: (Controller, float) -> None
+    def _add_controllers(self, controllers, timeout):
+        # type: (List[Controller], float) -> None
         with self._lock:
-            assert controller.mri not in self._controllers, \
-                "Controller already exists for %s" % controller.mri
-            self._controllers[controller.mri] = controller
-            controller.setup(self)
-        if self.state:
-            should_publish = self._start_controllers([controller], timeout)
+            mris = [controller.mri for controller in controllers]
+            for mri in mris:
+                assert mri not in self._controllers and mris.count(mri) == 1, \
+                    "Controller already exists for %s" % mri
+            for controller in controllers:
+                self._controllers[controller.mri] = controller
+                controller.setup(self)
+        if self.state and controllers:
+            should_publish = self._start_controllers(controllers, timeout)
             if self.state == STARTED and should_publish:
                 self._publish_controllers(timeout)
 
@@ -1,5 +1,6 @@
 from annotypes import Anno, Any
 
+from malcolm.compat import OrderedDict
 from .serializable import Serializable
 
 
@@ -74,3 +75,37 @@ class Delta(Response):
         # Should already be serialized
         self.changes = changes
 
+
+def apply_changes(value, changes):
+    """Return serialized value with the Delta changes applied to it. Each
+    dictionary along the path of a change is copied rather than modified, so
+    anything already holding a reference to value is unaffected
+
+    Args:
+        value: Serialized data to change
+        changes (list): [[path, new_data]] or [[path]] to delete, as in
+            Delta.changes
+    """
+    # ids of the dictionaries we have made, so can modify
+    copied = set()
+    for change in changes:
+        value = _apply_change(value, change[0], change[1:], copied)
+    return value
+
+
+def _apply_change(value, path, args, copied):
+    if not path:
+        # Replace, or delete if no data given
+        return args[0] if args else None
+    if id(value) not in copied:
+        d = OrderedDict()
+        for k, v in value.items():
+            d[k] = v
+        value = d
+        copied.add(id(value))
+    if args or len(path) > 1:
+        value[path[0]] = _apply_change(
+            value.get(path[0], None), path[1:], args, copied)
+    else:
+        value.pop(path[0], None)
+    return value
@@ -160,8 +160,7 @@ def make_process():
         proc = Process(proc_name)
         controllers, parts = make_include_creator(args.yaml)()
         assert not parts, "%s defines parts" % (args.yaml,)
-        for controller in controllers:
-            proc.add_controller(controller)
+        proc.add_controllers(controllers)
         proc_name = "%s - imalcolm" % proc_name
     else:
         proc = Process("Process")
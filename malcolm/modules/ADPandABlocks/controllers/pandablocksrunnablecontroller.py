@@ -35,7 +35,7 @@ class PandABlocksRunnableController(PandABlocksManagerController,
             use_cothread, use_git)
         self.prefix = prefix
 
-    def _make_child_controller(self, parts, mri):
+    def _make_child_controllers(self, parts, mri):
         # Add some extra parts to determine the dataset name and type for
         # any CAPTURE field part
         new_parts = []
@@ -69,14 +69,12 @@ class PandABlocksRunnableController(PandABlocksManagerController,
             controller = StatefulController(mri=mri)
             for p in new_parts + ps:
                 controller.add_part(p)
-            for c in cs:
-                self.process.add_controller(c)
+            # The include controllers are added to the process along with ours
+            controllers = cs + [controller]
         else:
-            controller = super(PandABlocksRunnableController, self).\
-                _make_child_controller(new_parts, mri)
-        return controller
-
-
+            controllers = super(PandABlocksRunnableController, self).\
+                _make_child_controllers(new_parts, mri)
+        return controllers
 
     def _make_corresponding_part(self, block_name, mri):
         if block_name == "PCAP":
@@ -3,7 +3,8 @@ from .statefulcontroller import StatefulController
 from .managercontroller import ManagerController, AConfigDir, AInitialDesign, \
     AUseGit
 from .clientcomms import ClientComms
-from .proxycontroller import ProxyController, AComms, APublish
+from .proxycontroller import ProxyController, AComms, APublish, \
+    ASyncFields, USyncFields
 from .servercomms import ServerComms
 
 # Expose a nice namespace
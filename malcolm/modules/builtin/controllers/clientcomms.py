@@ -1,20 +1,54 @@
+import time
+
+from annotypes import TYPE_CHECKING
+
+from malcolm.core import DEFAULT_TIMEOUT, TimeoutError
 from .statefulcontroller import StatefulController
 
+if TYPE_CHECKING:
+    from malcolm.core import Queue
+
+# Proxies that take longer than this many seconds to sync are logged
+SLOW_SYNC_TIME = 1.0
+
 
 class ClientComms(StatefulController):
     """Abstract class for dispatching requests to a server and responses to
     a method"""
 
-    def sync_proxy(self, mri, block):
+    def sync_proxy(self, mri, block, fields=()):
         """Abstract method telling the ClientComms to sync this proxy Block
         with its remote counterpart. Should wait until it is connected
 
         Args:
             mri (str): The mri for the remote block
             block (BlockModel): The local proxy Block to keep in sync
+            fields (Sequence[str]): If given, only sync these fields of the
+                remote block, as well as health and meta
         """
         raise NotImplementedError(self)
 
+    def wait_for_sync(self, mri, start, done_queue):
+        # type: (str, float, Queue) -> None
+        """Wait for a proxy to put the time it synced on its Queue, until
+        DEFAULT_TIMEOUT after start. Logs if it was slow, and raises
+        TimeoutError naming it if it didn't sync
+
+        Args:
+            mri (str): The mri for the remote block
+            start (float): The time the proxy started syncing
+            done_queue (Queue): The Queue the proxy will put the time on
+        """
+        try:
+            synced = done_queue.get(
+                timeout=max(start + DEFAULT_TIMEOUT - time.time(), 0))
+        except TimeoutError:
+            raise TimeoutError("Timeout waiting for %s to sync after %ss" % (
+                mri, DEFAULT_TIMEOUT))
+        if synced - start > SLOW_SYNC_TIME:
+            self.log.warning("Slow to sync proxy %s (%.1fs)",
+                             mri, synced - start)
+
     def send_put(self, mri, attribute_name, value):
         """Abstract method to dispatch a Put to the server
 
@@ -37,3 +71,36 @@ class ClientComms(StatefulController):
             The return results from the server
         """
         raise NotImplementedError(self)
+
+    def send_put_async(self, mri, attribute_name, value, get=False):
+        """Dispatch a Put to the server without waiting for the response.
+        ClientComms that can have many requests in flight should override this
+
+        Args:
+            mri (str): The mri of the Block
+            attribute_name (str): The name of the Attribute within the Block
+            value: The value to put
+            get (bool): Whether the server should return the new value
+
+        Returns:
+            Future: A concurrent.futures style Future with add_done_callback()
+                that will resolve to the return value, or None if the
+                ClientComms can only do blocking send_put()
+        """
+        return None
+
+    def send_post_async(self, mri, method_name, params):
+        """Dispatch a Post to the server without waiting for the response.
+        ClientComms that can have many requests in flight should override this
+
+        Args:
+            mri (str): The mri of the Block
+            method_name (str): The name of the Method within the Block
+            params (dict): The parameters to send
+
+        Returns:
+            Future: A concurrent.futures style Future with add_done_callback()
+                that will resolve to the return value, or None if the
+                ClientComms can only do blocking send_post()
+        """
+        return None
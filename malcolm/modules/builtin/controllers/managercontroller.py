@@ -15,6 +15,7 @@ from malcolm.modules.builtin.infos import PortInfo
 from malcolm.modules.builtin.util import ManagerStates
 from ..hooks import LayoutHook, LoadHook, SaveHook
 from ..infos import LayoutInfo, PartExportableInfo, PartModifiedInfo
+from ..parts.childpart import ChildPart
 from ..util import LayoutTable, ExportTable
 from .statefulcontroller import StatefulController, AMri, \
     ADescription, AUseCothread
@@ -112,6 +113,12 @@ class ManagerController(StatefulController):
         self.set_writeable_in(
             self.field_registry.add_method_model(self.save), ss.READY)
 
+    def get_start_dependencies(self):
+        # Our ChildParts wait for their children to initialize before they can
+        # initialize themselves
+        return [part.mri for part in self.parts.values()
+                if isinstance(part, ChildPart)]
+
     def _run_git_cmd(self, *args):
         # Run git command, don't care if it fails, logging the output
         if self.use_git and os.path.isdir(
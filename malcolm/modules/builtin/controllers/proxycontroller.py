@@ -1,33 +1,45 @@
 import functools
 
-from annotypes import Anno
+from annotypes import Anno, Array, Union, Sequence, TYPE_CHECKING
 
 from malcolm.core import Alarm, ProcessStartHook, UnpublishedInfo, \
-    UUnpublishedInfos, AUseCothread, Context
+    UUnpublishedInfos, AUseCothread, Context, AttributeModel, MethodModel, Put
 from .basiccontroller import BasicController, AMri
 from .clientcomms import ClientComms
 from ..util import wait_for_stateful_block_init
 
+if TYPE_CHECKING:
+    from typing import Any
+
 with Anno("Malcolm resource id of client comms"):
     AComms = str
 with Anno("Whether to re-publish this block via server comms"):
     APublish = bool
+with Anno("Fields of the remote block to sync, empty for all of them"):
+    ASyncFields = Array[str]
+USyncFields = Union[ASyncFields, Sequence[str], str]
 
 
 class ProxyController(BasicController):
     """Sync a local block with a given remote block"""
 
-    def __init__(self, mri, comms, publish=False, use_cothread=False):
-        # type: (AMri, AComms, APublish, AUseCothread) -> None
+    def __init__(self, mri, comms, publish=False, use_cothread=False,
+                 fields=()):
+        # type: (AMri, AComms, APublish, AUseCothread, USyncFields) -> None
         super(ProxyController, self).__init__(mri, use_cothread=use_cothread)
         self.comms = comms
         self.publish = publish
+        self.fields = ASyncFields(fields)
         self.client_comms = None
         self.health.set_value(
             "Uninitialized", alarm=Alarm.invalid("Uninitialized"))
         # Hooks
         self.register_hooked(ProcessStartHook, self.init)
 
+    def get_start_dependencies(self):
+        # We can't sync until our client comms has connected
+        return [self.comms]
+
     def init(self):
         # type: () -> UUnpublishedInfos
         self.client_comms = self.process.get_controller(
@@ -36,7 +48,7 @@ class ProxyController(BasicController):
         context = Context(self.process, self.use_cothread)
         wait_for_stateful_block_init(context, self.comms)
         # Tell the client comms to sync our block for us
-        self.client_comms.sync_proxy(self.mri, self._block)
+        self.client_comms.sync_proxy(self.mri, self._block, self.fields)
         if not self.publish:
             return UnpublishedInfo(self.mri)
 
@@ -48,6 +60,56 @@ class ProxyController(BasicController):
         return functools.partial(
             self.client_comms.send_put, self.mri, attribute_name)
 
+    def _handle_put(self, request):
+        """Called with the lock taken. If the client comms can pipeline
+        requests then send it without waiting, and respond when it returns"""
+        attribute_name = request.path[1]
+        attribute = self._block[attribute_name]
+        assert isinstance(attribute, AttributeModel), \
+            "Cannot Put to %s which is a %s" % (attribute.path, type(attribute))
+        value = attribute.meta.validate(request.value)
+        future = self.client_comms.send_put_async(
+            self.mri, attribute_name, value)
+        if future is None:
+            with self.lock_released:
+                self.client_comms.send_put(self.mri, attribute_name, value)
+            return [request.return_response(self._put_result(request))]
+        future.add_done_callback(functools.partial(self._respond, request))
+        return []
+
+    def _put_result(self, request):
+        # type: (Put) -> Any
+        # Like Controller, return our own value if asked for it. The client
+        # comms has updated it by the time the server has responded
+        if request.get:
+            return self._block[request.path[1]].value
+
+    def _handle_post(self, request):
+        """Called with the lock taken. If the client comms can pipeline
+        requests then send it without waiting, and respond when it returns"""
+        method_name = request.path[1]
+        method = self._block[method_name]
+        assert isinstance(method, MethodModel), \
+            "Cannot Post to %s which is a %s" % (method.path, type(method))
+        args = method.validate(request.parameters)
+        future = self.client_comms.send_post_async(self.mri, method_name, args)
+        if future is None:
+            return super(ProxyController, self)._handle_post(request)
+        future.add_done_callback(functools.partial(self._respond, request))
+        return []
+
+    def _respond(self, request, future):
+        # Called from the client comms when the server has responded
+        try:
+            result = future.result()
+        except Exception as e:
+            cb, response = request.error_response(e)
+        else:
+            if isinstance(request, Put):
+                result = self._put_result(request)
+            cb, response = request.return_response(result)
+        cb(response)
+
     def check_field_writeable(self, field):
         # Let the server do this
         pass
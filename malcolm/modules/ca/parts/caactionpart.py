@@ -2,7 +2,8 @@ from annotypes import Anno
 
 from malcolm.core import Part, PartRegistrar
 from malcolm.modules import builtin
-from ..util import CaToolsHelper, APartName, AMetaDescription, APv
+from ..util import CaToolsHelper, APartName, AMetaDescription, APv, \
+    batch_key
 
 with Anno("Status pv to see if successful"):
     StatusPv = str
@@ -39,6 +40,7 @@ class CAActionPart(Part):
         self.message_pv = message_pv
         self.value = value
         self.wait = wait
+        self._batch_key = None
         # Hooks
         self.register_hooked((builtin.hooks.InitHook,
                               builtin.hooks.ResetHook), self.connect_pvs)
@@ -47,6 +49,7 @@ class CAActionPart(Part):
         # type: (PartRegistrar) -> None
         super(CAActionPart, self).setup(registrar)
         registrar.add_method_model(self.caput, self.name, self.description)
+        self._batch_key = batch_key(registrar)
 
     def connect_pvs(self):
         pvs = [self.pv]
@@ -54,10 +57,7 @@ class CAActionPart(Part):
             pvs.append(self.status_pv)
         if self.message_pv:
             pvs.append(self.message_pv)
-        ca_values = self.catools.caget(pvs)
-        # check connection is ok
-        for i, v in enumerate(ca_values):
-            assert v.ok, "CA connect failed with %s" % v.state_strings[v.state]
+        self.catools.checking_caget(pvs, batch_key=self._batch_key)
 
     def caput(self):
         self.log.info("caput %s %s", self.pv, self.value)
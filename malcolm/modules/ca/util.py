@@ -3,9 +3,10 @@ import time
 
 from annotypes import Anno, TYPE_CHECKING
 
-from malcolm.compat import maybe_import_cothread
+from malcolm.compat import maybe_import_cothread, OrderedDict
 from malcolm.core import Queue, VMeta, Alarm, AlarmStatus, TimeStamp, \
-    Loggable, APartName, AMetaDescription, Hook, PartRegistrar, DEFAULT_TIMEOUT
+    Loggable, APartName, AMetaDescription, Hook, PartRegistrar, \
+    DEFAULT_TIMEOUT, NumberMeta
 from malcolm.modules.builtin.util import set_tags, AWidget, AGroup, AConfig, \
     ASinkPort
 from malcolm.modules.builtin.hooks import InitHook, ResetHook, DisableHook
@@ -18,6 +19,13 @@ if TYPE_CHECKING:
     Register = Callable[(Hooks, Callable, Optional[ArgsGen]), None]
 
 
+# Minimum time between logging and publishing how many monitor updates have
+# been dropped
+DROPPED_LOG_PERIOD = 10.0
+
+# Time to wait for each PV to connect in checking_caget
+CONNECT_TIMEOUT = 5.0
+
 # Store them here for re-export
 APartName = APartName
 AMetaDescription = AMetaDescription
@@ -71,17 +79,36 @@ class CAAttribute(Loggable):
         # Camonitor subscription
         self.monitor = None
         self.catools = CaToolsHelper.instance()
+        # The Block we belong to, so our initial caget can share its batch
+        self._batch_key = None
         self._update_after = 0
+        # Latest monitor value waiting for the min_delta window to expire
+        self._pending = None
+        self._waiting = False
+        self._severity = None
+        # Number of monitor values not posted because a newer one came in
+        # the same min_delta window, logged and published on the dropped_attr
+        # every DROPPED_LOG_PERIOD
+        self.dropped = 0
+        self.dropped_attr = NumberMeta(
+            "int64", "Number of monitor updates of %s dropped within "
+            "min_delta" % rbv).create_attribute_model(0)
+        self._dropped_logged = 0
+        self._log_dropped_after = 0
 
     def reconnect(self):
         # release old monitor
         self.disconnect()
+        # so the first update of the new monitor is posted straight away
+        self._severity = None
+        self._update_after = 0
         # make the connection in cothread's thread, use caget for initial value
         pvs = [self.rbv]
         if self.pv and self.pv != self.rbv:
             pvs.append(self.pv)
         ca_values = self.catools.checking_caget(
-            pvs, format=self.catools.FORMAT_CTRL, datatype=self.datatype)
+            pvs, batch_key=self._batch_key,
+            format=self.catools.FORMAT_CTRL, datatype=self.datatype)
         if self.on_connect:
             self.on_connect(ca_values[0])
         self._update_value(ca_values[0])
@@ -95,6 +122,7 @@ class CAAttribute(Loggable):
         if self.monitor is not None:
             self.monitor.close()
             self.monitor = None
+        self._pending = None
 
     def caput(self, value):
         if self.timeout < 0:
@@ -112,20 +140,52 @@ class CAAttribute(Loggable):
         self._update_value(value)
 
     def _monitor_callback(self, value):
+        # Called in cothread's thread
         now = time.time()
-        delta = now - self._update_after
-        self._update_value(value)
-        # See how long to sleep for to make sure we don't get more than one
-        # update at < min_delta interval
-        if delta > self.min_delta:
-            # If we were more than min_delta late then reset next update time
-            self._update_after = now + self.min_delta
-        elif delta < 0:
-            # If delta is less than zero sleep for a bit
-            self.catools.cothread.Sleep(-delta)
+        severity = value.severity if value.ok else None
+        if not value.ok or severity != self._severity:
+            # Disconnects and alarm changes are posted straight away
+            self._post(value, now)
+        elif now >= self._update_after and self._pending is None:
+            # Outside the min_delta window
+            self._post(value, now)
         else:
-            # If we were within the delta window just increment next update
-            self._update_after += self.min_delta
+            # Keep the latest value to post when the window expires
+            if self._pending is None:
+                if not self._waiting:
+                    self._waiting = True
+                    self.catools.cothread.Spawn(self._post_pending)
+            else:
+                self.dropped += 1
+            self._pending = value
+
+    def _post(self, value, now):
+        if self._pending is not None:
+            # Superseded by a newer value
+            self.dropped += 1
+            self._pending = None
+        self._severity = value.severity if value.ok else None
+        self._update_after = now + self.min_delta
+        self._update_value(value)
+        if self.dropped != self._dropped_logged and \
+                now >= self._log_dropped_after:
+            self.log.debug(
+                "Dropped %d monitor updates within min_delta, %d in total",
+                self.dropped - self._dropped_logged, self.dropped)
+            self._dropped_logged = self.dropped
+            self._log_dropped_after = now + DROPPED_LOG_PERIOD
+            self.dropped_attr.set_value(self.dropped)
+
+    def _post_pending(self):
+        # Called in cothread's thread
+        while self._pending is not None:
+            delay = self._update_after - time.time()
+            if delay > 0:
+                self.catools.cothread.Sleep(delay)
+            else:
+                value, self._pending = self._pending, None
+                self._post(value, time.time())
+        self._waiting = False
 
     def _update_value(self, value):
         if not value.ok:
@@ -151,10 +211,19 @@ class CAAttribute(Loggable):
         else:
             writeable_func = None
         registrar.add_attribute_model(name, self.attr, writeable_func)
+        registrar.add_attribute_model(name + "Dropped", self.dropped_attr)
+        self._batch_key = batch_key(registrar)
         register_hooked(DisableHook, self.disconnect)
         register_hooked((InitHook, ResetHook), self.reconnect)
 
 
+def batch_key(registrar):
+    # type: (PartRegistrar) -> Any
+    """Return the key that checking_caget uses to batch the requests of all
+    the parts of a Block. There is one field registry per Controller"""
+    return registrar._field_registry
+
+
 def _import_cothread(q):
     import cothread
     from cothread import catools
@@ -190,6 +259,10 @@ class CaToolsHelper(object):
         self.FORMAT_TIME = catools.FORMAT_TIME
         self.DBR_ENUM = catools.DBR_ENUM
         self.DBR_CHAR_STR = catools.DBR_CHAR_STR
+        # {(batch_key, kwargs): [(pvs, done_queue)]} waiting to be passed to
+        # cothread's thread
+        self._batch = None  # type: Optional[OrderedDict]
+        self._batch_lock = threading.Lock()
 
     def caget(self, *args, **kwargs):
         if self.in_cothread_thread:
@@ -212,13 +285,67 @@ class CaToolsHelper(object):
             return self.cothread.CallbackResult(
                 self.catools.camonitor, *args, **kwargs)
 
-    def checking_caget(self, values, *args, **kwargs):
-        ca_values = self.caget(values, *args, **kwargs)
-        # check connection is ok
-        for i, v in enumerate(ca_values):
-            assert v.ok, "CA connect failed with %s" % v.state_strings[v.state]
+    def checking_caget(self, pvs, batch_key=None, **kwargs):
+        """caget a list of pvs, raising an error if any failed to connect.
+
+        Requests made at the same time with the same batch_key and kwargs,
+        like those from all the CA parts of a Block on InitHook or ResetHook,
+        are done in a single caget. Each PV has CONNECT_TIMEOUT to connect,
+        and different batches don't wait for each other
+        """
+        done = Queue()
+        self._add_to_batch(pvs, (batch_key, tuple(sorted(kwargs.items()))),
+                           done)
+        ca_values = done.get(timeout=DEFAULT_TIMEOUT)
+        if isinstance(ca_values, Exception):
+            raise ca_values
         return ca_values
 
+    def _add_to_batch(self, pvs, key, done):
+        # Called from any thread. The first request schedules the cagets,
+        # anything added before they start goes with it
+        with self._batch_lock:
+            start = self._batch is None
+            if start:
+                self._batch = OrderedDict()
+            self._batch.setdefault(key, []).append((pvs, done))
+        if not start:
+            return
+        elif self.in_cothread_thread:
+            self.cothread.Spawn(self._caget_batch)
+        else:
+            self.cothread.Callback(self._caget_batch)
+
+    def _caget_batch(self):
+        # Called in cothread's thread
+        with self._batch_lock:
+            batch, self._batch = self._batch, None
+        for (_, kwargs), requests in batch.items():
+            self.cothread.Spawn(self._caget_requests, requests, dict(kwargs))
+
+    def _caget_requests(self, requests, kwargs):
+        # Called in cothread's thread
+        pvs = []
+        for request_pvs, _ in requests:
+            pvs += [pv for pv in request_pvs if pv not in pvs]
+        try:
+            ca_values = self.catools.caget(
+                pvs, throw=False, timeout=CONNECT_TIMEOUT, **kwargs)
+        except Exception as e:
+            for _, done in requests:
+                done.put(e)
+            return
+        ca_values = dict(zip(pvs, ca_values))
+        for request_pvs, done in requests:
+            values = [ca_values[pv] for pv in request_pvs]
+            # check connection is ok
+            failed = [v for v in values if not v.ok]
+            if failed:
+                done.put(
+                    AssertionError("CA connect failed with %s" % failed[0]))
+            else:
+                done.put(values)
+
     @classmethod
     def instance(cls):
         if not cls._instance:
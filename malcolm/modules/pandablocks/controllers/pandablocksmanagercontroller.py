@@ -121,6 +121,7 @@ class PandABlocksManagerController(ManagerController):
         # {block_name_without_number: BlockData}
         self._blocks_data = OrderedDict()
         self._blocks_parts = OrderedDict()
+        controllers = []
         for block_rootname, block_data in self.client.get_blocks_data().items():
             block_names = []
             if block_data.number == 1:
@@ -130,14 +131,19 @@ class PandABlocksManagerController(ManagerController):
                     block_names.append("%s%d" % (block_rootname, i + 1))
             for block_name in block_names:
                 self._blocks_data[block_name] = block_data
-                self._make_parts(block_name, block_data)
+                controllers += self._make_parts(block_name, block_data)
+        # Add all the child controllers to the process together so they are
+        # started together and only published once
+        self.process.add_controllers(controllers, timeout=5)
         # Handle the initial set of changes to get an initial value
         self.handle_changes(self.client.get_changes())
         # Then once more to let bit_outs toggle back
         self.handle_changes({})
         assert not self.changes, "There are still changes %s" % self.changes
 
-    def _make_child_controller(self, parts, mri):
+    def _make_child_controllers(self, parts, mri):
+        # Return the controllers to add to the process, with the one hosting
+        # the Block for mri last
         controller = BasicController(mri=mri)
         if mri.endswith("PCAP"):
             parts.append(PandABlocksActionPart(
@@ -146,7 +152,7 @@ class PandABlocksManagerController(ManagerController):
                 self.client, "*PCAP", "DISARM", "Disarm position capture", []))
         for part in parts:
             controller.add_part(part)
-        return controller
+        return [controller]
 
     def _make_corresponding_part(self, block_name, mri):
         part = ChildPart(name=block_name, mri=mri, stateful=False)
@@ -158,9 +164,8 @@ class PandABlocksManagerController(ManagerController):
         # Defer creation of parts to a block maker
         maker = PandABlocksMaker(self.client, block_name, block_data)
 
-        # Make the child controller and add it to the process
-        controller = self._make_child_controller(maker.parts.values(), mri)
-        self.process.add_controller(controller, timeout=5)
+        # Make the child controllers, the caller will add them to the process
+        controllers = self._make_child_controllers(maker.parts.values(), mri)
 
         # Store the parts so we can update them with the poller
         self._blocks_parts[block_name] = maker.parts
@@ -168,6 +173,7 @@ class PandABlocksManagerController(ManagerController):
         # Make the corresponding part for us
         child_part = self._make_corresponding_part(block_name, mri)
         self.add_part(child_part)
+        return controllers
 
     def _set_lut_icon(self, block_name):
         icon_attr = self._blocks_parts[block_name]["icon"].attr
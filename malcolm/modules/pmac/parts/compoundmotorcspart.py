@@ -17,6 +17,7 @@ class CompoundMotorCSPart(Part):
         self.rbv = rbv
         self.attr = meta.create_attribute_model()
         self.catools = ca.util.CaToolsHelper.instance()
+        self._batch_key = None
         # Subscriptions
         self.monitor = None
         # Hooks
@@ -27,13 +28,15 @@ class CompoundMotorCSPart(Part):
     def setup(self, registrar):
         # type: (PartRegistrar) -> None
         registrar.add_attribute_model(self.name, self.attr)
+        self._batch_key = ca.util.batch_key(registrar)
 
     def reconnect(self):
         # release old monitors
         self.disconnect()
         # make sure we can connect to the pvs
         ca_values = self.catools.checking_caget(
-            [self.rbv], format=self.catools.FORMAT_CTRL)
+            [self.rbv], format=self.catools.FORMAT_CTRL,
+            batch_key=self._batch_key)
         # Set initial value
         self._update_value(ca_values[0])
         # Setup monitor on rbv
@@ -22,6 +22,7 @@ class RawMotorCSPart(Part):
             meta, writeable=True, group=group, sink_port=Port.MOTOR)
         self.attr = meta.create_attribute_model()
         self.catools = ca.util.CaToolsHelper.instance()
+        self._batch_key = None
         # Subscriptions
         self.monitors = []
         self.port = None
@@ -35,13 +36,15 @@ class RawMotorCSPart(Part):
     def setup(self, registrar):
         # type: (PartRegistrar) -> None
         registrar.add_attribute_model(self.name, self.attr, self.caput)
+        self._batch_key = ca.util.batch_key(registrar)
 
     def reconnect(self):
         # release old monitors
         self.disconnect()
         # make sure we can connect to the pvs
         ca_values = self.catools.checking_caget(
-            self.pvs + self.rbvs, format=self.catools.FORMAT_CTRL)
+            self.pvs + self.rbvs, format=self.catools.FORMAT_CTRL,
+            batch_key=self._batch_key)
         # Set initial value
         self.port_choices = ca_values[0].enums
         choices = [""]
@@ -1,5 +1,5 @@
 from .pvaclientcomms import PvaClientComms
-from .pvaservercomms import PvaServerComms
+from .pvaservercomms import PvaServerComms, AMaxRate
 
 # Expose a nice namespace
 from malcolm.core import submodule_all
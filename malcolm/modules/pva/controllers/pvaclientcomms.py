@@ -1,3 +1,5 @@
+import time
+
 from p4p import Value
 from p4p.client.raw import Disconnected, RemoteError
 from p4p.nt import NTURI
@@ -7,7 +9,8 @@ from malcolm.compat import maybe_import_cothread
 from malcolm.modules.builtin.controllers import ClientComms
 from malcolm.core import Queue, Model, DEFAULT_TIMEOUT, BlockMeta, \
     serialize_object, BlockModel, Alarm
-from .pvaconvert import convert_value_to_dict, convert_to_type_tuple_value, Type
+from .pvaconvert import convert_value_to_dict, convert_to_type_tuple_value, \
+    get_type
 
 
 if TYPE_CHECKING:
@@ -50,14 +53,24 @@ class PvaClientComms(ClientComms):
             # This is a terminal field, add to the set
             update_fields.add(dotted_path)
 
-    def sync_proxy(self, mri, block):
+    def sync_proxy(self, mri, block, fields=()):
         """Abstract method telling the ClientComms to sync this proxy Block
         with its remote counterpart. Should wait until it is connected
 
         Args:
             mri (str): The mri for the remote block
             block (BlockModel): The local proxy Block to keep in sync
+            fields (Sequence[str]): If given, only sync these fields of the
+                remote block, as well as health and meta
         """
+        start = time.time()
+        if fields:
+            # Ask the server to only send the fields we need
+            request = "field(%s)" % ",".join(
+                ["health", "meta"] +
+                [f for f in fields if f not in ("health", "meta")])
+        else:
+            request = None
         done_queue = Queue()
         self._queues[mri] = done_queue
         update_fields = set()
@@ -76,18 +89,22 @@ class PvaClientComms(ClientComms):
                 with block.notifier.changes_squashed:
                     if not update_fields:
                         self.log.debug("Regenerating from %s", list(value))
-                        self._regenerate_block(block, value, update_fields)
-                        done_queue.put(None)
+                        self._regenerate_block(
+                            block, value, update_fields, bool(fields))
+                        done_queue.put(time.time())
                     else:
                         self._update_block(block, value, update_fields)
 
-        m = self._ctxt.monitor(mri, callback, notify_disconnect=True)
+        m = self._ctxt.monitor(
+            mri, callback, request=request, notify_disconnect=True)
         self._monitors.add(m)
-        done_queue.get(timeout=DEFAULT_TIMEOUT)
+        self.wait_for_sync(mri, start, done_queue)
 
-    def _regenerate_block(self, block, value, update_fields):
-        # type: (BlockModel, Value, Set[str]) -> None
-        # This is an initial update, generate the list of all fields
+    def _regenerate_block(self, block, value, update_fields, partial=False):
+        # type: (BlockModel, Value, Set[str], bool) -> None
+        # This is an initial update, generate the list of all fields. If
+        # partial then value only has some of the fields of the remote Block
+        # so leave our BlockMeta to list the ones we have
         # TODO: very similar to websocketclientcomms
         for field in list(block):
             if field not in ("health", "meta"):
@@ -103,13 +120,16 @@ class PvaClientComms(ClientComms):
                 # Update BlockMeta
                 meta = block.meta  # type: BlockMeta
                 for n in meta.call_types:
-                    meta.apply_change([n], v[n])
+                    if not (partial and n == "fields"):
+                        meta.apply_change([n], v[n])
             else:
                 # Add new Attribute/Method
                 v = convert_value_to_dict(v)
                 block.set_endpoint_data(k, v)
             # Update the list of fields
             self._update_settable_fields(update_fields, k, block[k])
+        if partial:
+            update_fields.discard("meta.fields")
 
     def _update_block(self, block, value, update_fields):
         # type: (BlockModel, Value, Set[str]) -> None
@@ -134,7 +154,7 @@ class PvaClientComms(ClientComms):
         if isinstance(typ, tuple):
             # Structure, make into a Value
             _, typeid, fields = typ
-            value = Value(Type(fields, typeid), value)
+            value = Value(get_type(fields, typeid), value)
         try:
             self._ctxt.put(mri, {path: value}, path)
         except RemoteError:
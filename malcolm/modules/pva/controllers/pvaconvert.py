@@ -6,10 +6,16 @@ import numpy as np
 from malcolm.compat import str_, long_, OrderedDict
 
 if TYPE_CHECKING:
-    from typing import Dict, Tuple, List, Any
+    from typing import Dict, Tuple, List, Any, Callable
 
 EMPTY = Value(Type([]))
 
+# Maximum number of structure Types to keep in _type_cache
+TYPE_CACHE_SIZE = 1000
+
+# {(typeid, fields): Type} so structures with the same layout share a Type
+_type_cache = {}  # type: Dict[Tuple[str, Tuple], Type]
+
 # https://mdavidsaver.github.io/p4p/values.html
 type_specifiers = {
     np.bool_: '?',
@@ -49,7 +55,12 @@ except NameError:
 
 def convert_to_type_tuple_value(value):
     # type: (Any) -> Tuple[Any, Any]
-    if isinstance(value, Array):
+    # Most values are primitives, and isinstance(value, Array) is slow, so
+    # check for those first
+    spec = type_specifiers.get(type(value), None)
+    if spec is not None:
+        return spec, value
+    elif isinstance(value, Array):
         if issubclass(value.typ, Enum):
             typ = str
             value_for_set = [x.value for x in value.seq]
@@ -63,6 +74,18 @@ def convert_to_type_tuple_value(value):
             "Expected 1d array, got {}".format(value.shape)
         spec = 'a' + type_specifiers[value.dtype.type]
         value_for_set = value
+    elif isinstance(value, list) and value and \
+            type(value[0]) in type_specifiers and \
+            len(set(map(type, value))) == 1:
+        # A list of a single primitive type, which is most of them, so we can
+        # get the spec without converting every element
+        typ = type(value[0])
+        spec = 'a' + type_specifiers[typ]
+        if spec == 'as':
+            value_for_set = value
+        else:
+            # Give p4p a contiguous buffer it can copy in one go
+            value_for_set = np.array(value, dtype=typ)
     elif isinstance(value, list):
         specs = set()
         for v in value:
@@ -96,16 +119,44 @@ def convert_to_type_tuple_value(value):
                 t, v_set = convert_to_type_tuple_value(v)
                 fields.append((k, t))
                 value_for_set[k] = v_set
-        spec = ('S', typeid, fields)
+        # Tuple rather than list so it can be used as a key in _type_cache
+        spec = ('S', typeid, tuple(fields))
     elif isinstance(value, Enum):
         spec = 's'
         value_for_set = value.value
     else:
-        spec = type_specifiers[type(value)]
-        value_for_set = value
+        # Not a type we know how to convert
+        raise KeyError(type(value))
     return spec, value_for_set
 
 
+def get_type(fields, typeid):
+    # type: (Tuple, str) -> Type
+    """Return a Type for a structure, reusing one made earlier if the layout
+    is the same
+
+    Args:
+        fields: Fields as produced by convert_to_type_tuple_value, each a
+            tuple of (name, spec)
+        typeid: The typeid of the structure
+    """
+    key = (typeid, fields)
+    try:
+        return _type_cache[key]
+    except KeyError:
+        pass
+    try:
+        typ = Type(fields, typeid)
+    except RuntimeError as e:
+        raise RuntimeError(
+            "%s when doing Type(%s, %s)" % (e, fields, typeid))
+    if len(_type_cache) >= TYPE_CACHE_SIZE:
+        # Something is making lots of different structures, start again
+        _type_cache.clear()
+    _type_cache[key] = typ
+    return typ
+
+
 def convert_from_type_spec(spec, val):
     # type: (str, Any) -> Any
     if isinstance(spec, Type):
@@ -129,12 +180,7 @@ def convert_dict_to_value(d):
         val = EMPTY
     else:
         (_, typeid, fields), value_for_set = convert_to_type_tuple_value(d)
-        try:
-            typ = Type(fields, typeid)
-        except RuntimeError as e:
-            raise RuntimeError(
-                "%s when doing Type(%s, %s)" % (e, fields, typeid))
-        val = Value(typ, value_for_set)
+        val = Value(get_type(fields, typeid), value_for_set)
     return val
 
 
@@ -157,3 +203,88 @@ def update_path(value, path, update):
         value = value[p]
     _, update = convert_to_type_tuple_value(update)
     value[path[-1]] = update
+
+
+def compile_setter(parent, name, update):
+    # type: (Value, str, Any) -> Callable[[Any], None]
+    """Return a function that sets parent[name] from serialized data of the
+    same type as update, choosing how to convert it now rather than every
+    time it is called. Raises KeyError if the data doesn't fit the type of
+    parent[name]
+
+    Args:
+        parent: The structure containing the field to update
+        name: The name of the field
+        update: Example of the serialized data the function will be passed
+    """
+    typ = type(update)
+    if typ in type_specifiers or typ is np.ndarray:
+        # p4p can take these as they are
+        def setter(u):
+            parent[name] = u
+    elif isinstance(update, Array):
+        def setter(u):
+            if issubclass(u.typ, Enum):
+                parent[name] = [x.value for x in u.seq]
+            else:
+                parent[name] = u.seq
+    elif isinstance(update, Enum):
+        def setter(u):
+            parent[name] = u.value
+    elif isinstance(update, dict):
+        # Set each field of the sub structure with its own setter, made
+        # when we first see it
+        sub_value = parent[name]
+        setters = {}
+
+        def setter(u):
+            for k, v in u.items():
+                if k != "typeid":
+                    key = (k, type(v))
+                    try:
+                        sub_setter = setters[key]
+                    except KeyError:
+                        sub_setter = compile_setter(sub_value, k, v)
+                        setters[key] = sub_setter
+                    sub_setter(v)
+    else:
+        def setter(u):
+            parent[name] = convert_to_type_tuple_value(u)[1]
+    return setter
+
+
+def compile_update(value, path, update):
+    # type: (Value, List[str], Any) -> Callable[[Any], None]
+    """Return a function that does update_path(value, path, u) for serialized
+    data u of the same type as update, with the walk down path already done.
+    Raises KeyError if path doesn't exist in value"""
+    for p in path[:-1]:
+        value = value[p]
+    return compile_setter(value, path[-1], update)
+
+
+def replace_fields(value, fields):
+    # type: (Value, Dict[str, Any]) -> Value
+    """Return a Value with a different type, made by replacing top level
+    fields with new serialized data, adding them if they don't exist, or
+    deleting them if their data is None. Every other field is copied from
+    value as is
+
+    Args:
+        value: The Value to start from, not modified
+        fields: {name: data} of the fields to change
+    """
+    specs = []
+    value_for_set = {}
+    for k, spec in value.type().items():
+        if k not in fields:
+            specs.append((k, spec))
+            value_for_set[k] = value[k]
+        elif fields[k] is not None:
+            spec, value_for_set[k] = convert_to_type_tuple_value(fields[k])
+            specs.append((k, spec))
+    for k, data in fields.items():
+        if k not in value_for_set and data is not None:
+            spec, value_for_set[k] = convert_to_type_tuple_value(data)
+            specs.append((k, spec))
+    return Value(Type(specs, value.getID()), value_for_set)
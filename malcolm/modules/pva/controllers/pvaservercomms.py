@@ -1,21 +1,24 @@
+import functools
+import threading
 import time
 
-from annotypes import add_call_types, TYPE_CHECKING
+from annotypes import add_call_types, TYPE_CHECKING, Anno
 from p4p import Value
 from p4p.server import Server, DynamicProvider, ServerOperation
 
-from malcolm.compat import maybe_import_cothread
+from malcolm.compat import maybe_import_cothread, OrderedDict, \
+    get_thread_ident
 from malcolm.core import Subscribe, Error, APublished, Controller, Delta, \
     Return, stringify_error, Response, Put, Post, Unsubscribe, \
     ProcessPublishHook, method_return_unpacked, Method, serialize_object, \
-    BlockMeta, MethodModel
+    BlockMeta, MethodModel, apply_changes
 from malcolm.core.rlock import RLock
 from malcolm.modules import builtin
-from .pvaconvert import convert_dict_to_value, update_path, \
-    convert_value_to_dict
+from .pvaconvert import convert_dict_to_value, compile_update, \
+    convert_value_to_dict, replace_fields
 
 if TYPE_CHECKING:
-    from typing import Optional, Dict, List, Set
+    from typing import Optional, Dict, List, Set, Tuple, Callable, Any
 
 
 cothread = maybe_import_cothread()
@@ -26,9 +29,14 @@ else:
     from p4p.server.thread import Handler, SharedPV
 
 
+with Anno("Maximum number of updates per second to post to the clients of "
+          "each PV, 0 for no limit"):
+    AMaxRate = float
+
+
 class BlockHandler(Handler):
-    def __init__(self, controller, field=None):
-        # type: (Controller, str) -> None
+    def __init__(self, controller, field=None, max_rate=0.0):
+        # type: (Controller, str, float) -> None
         self.controller = controller
         # Lock to control access to self.pv
         self._lock = RLock(controller.use_cothread)
@@ -36,6 +44,18 @@ class BlockHandler(Handler):
         self.pv = None  # type: Optional[SharedPV]
         self.value = None  # type: Value
         self.put_paths = None  # type: Set[str]
+        # {(path, type(data)): setter} made by compile_update for self.value
+        self._setters = {}  # type: Dict[Tuple, Callable[[Any], None]]
+        # {method_name: whether its return needs wrapping} for rpc, forgotten
+        # when a Delta changes the method or the BlockMeta. None means it is
+        # being looked up
+        self._methods = {}  # type: Dict[str, Optional[bool]]
+        # Changes are merged into a single post if they come faster than this
+        self._min_period = 1.0 / max_rate if max_rate > 0 else 0.0
+        self._last_posted = 0.0
+        # Incremented when a delayed post is scheduled or no longer needed
+        self._post_generation = 0
+        self._post_pending = False
 
     def rpc(self, pv, op):
         # type: (SharedPV, ServerOperation) -> None
@@ -61,10 +81,7 @@ class BlockHandler(Handler):
                 assert method, "No 'method' in pvRequest:\n%s" % op.pvRequest()
             parameters = convert_value_to_dict(value)
         path = [self.controller.mri, method]
-        view = self.controller.make_view()[method]
-        assert isinstance(view, Method), \
-            "%s.%s is not a Method so cannot do RPC" % tuple(path)
-        add_wrapper = method_return_unpacked() in view.tags
+        add_wrapper = self._return_unpacked(method)
 
         post = Post(path=path, parameters=parameters)
 
@@ -90,6 +107,44 @@ class BlockHandler(Handler):
         post.set_callback(handle_post_response)
         self.controller.handle_request(post).get()
 
+    def _return_unpacked(self, method):
+        # type: (str) -> bool
+        # Check method is a Method and return whether it has the
+        # method_return_unpacked tag, only making a view if it isn't cached
+        with self._lock:
+            add_wrapper = self._methods.get(method)
+            if add_wrapper is not None:
+                return add_wrapper
+            self._methods[method] = None
+        try:
+            view = self.controller.make_view()[method]
+            assert isinstance(view, Method), \
+                "%s.%s is not a Method so cannot do RPC" % (
+                    self.controller.mri, method)
+        except Exception:
+            with self._lock:
+                self._methods.pop(method, None)
+            raise
+        add_wrapper = method_return_unpacked() in view.tags
+        with self._lock:
+            # Only cache it if a Delta hasn't forgotten it while we looked
+            if method in self._methods:
+                self._methods[method] = add_wrapper
+        return add_wrapper
+
+    def _forget_methods(self, changes):
+        # type: (List[List]) -> None
+        # Called with the lock taken
+        for change in changes:
+            if not self._methods:
+                return
+            path = change[0]
+            if self.field is not None or not path or path[0] == "meta":
+                # The method we serve, or the fields of the Block, changed
+                self._methods.clear()
+            else:
+                self._methods.pop(path[0], None)
+
     def put(self, pv, op):
         # type: (SharedPV, ServerOperation) -> None
         path = [self.controller.mri]
@@ -147,6 +202,8 @@ class BlockHandler(Handler):
         # Called from whatever thread the child block could be in, so
         # must already be a good thread to take the lock
         with self._lock:
+            if isinstance(response, Delta):
+                self._forget_methods(response.changes)
             if self.pv and isinstance(response, Delta):
                 # We got a delta, create or update value and notify
                 if self.value is None:
@@ -167,7 +224,13 @@ class BlockHandler(Handler):
     def _create_initial_value(self, d):
         # type: (Dict) -> None
         # Called with the lock taken
-        self.value = convert_dict_to_value(d)
+        self._open(convert_dict_to_value(d))
+
+    def _open(self, value):
+        # type: (Value) -> None
+        # Called with the lock taken
+        self.value = value
+        self._setters = {}
         unputtable_ids = (MethodModel.typeid, BlockMeta.typeid)
         if not self.field:
             self.put_paths = set(
@@ -179,46 +242,97 @@ class BlockHandler(Handler):
             self.put_paths = set()
         self.controller.log.debug("Opening with %s", list(self.value))
         self.pv.open(self.value)
+        # The whole value is sent on open, so cancel any delayed post
+        self._last_posted = time.time()
+        self._post_pending = False
 
     def _update_value(self, delta):
         # type: (Delta) -> None
         # Called with the lock taken
-        self.value.unmark()
-        # This will be set if we need to change type
-        new_typed_value = None  # type: Dict
+        if not self._post_pending:
+            # Last changes were posted, so start marking afresh. Otherwise
+            # keep the marks so the delayed post has all the changes
+            self.value.unmark()
+        # {name: data} for the top level fields that need a type change
+        branches = OrderedDict()
         for change in delta.changes:
-            if len(change) == 1:
-                # Delete a field, type change
-                if new_typed_value is None:
-                    new_typed_value = convert_value_to_dict(self.value)
-                v = new_typed_value
-                for k in change[0][:-1]:
-                    v = v[k]
-                v.pop(change[0][-1])
+            # Path will have at least one element
+            path = change[0]
+            assert len(path) > 0, \
+                "Can't handle root update %s after initial" % (change,)
+            name = path[0]
+            if name not in branches and len(change) == 2:
+                try:
+                    self._update_path(path, change[1])
+                    continue
+                except KeyError:
+                    # Tried to add to a field that doesn't exist, or change
+                    # the structure of one that does
+                    pass
+            # Type change, so work out the new data for this top level field
+            if name in branches:
+                data = branches[name]
+            elif len(path) > 1:
+                data = convert_value_to_dict(self.value[name])
             else:
-                assert len(change[0]) > 0, \
-                    "Can't handle root update %s after initial" % (change,)
-                # Path will have at least one element
-                path, update = change
-                if new_typed_value is None:
-                    try:
-                        update_path(self.value, path, update)
-                    except KeyError:
-                        # Tried to add to a field that doesn't exist, force a
-                        # reconnect
-                        new_typed_value = convert_value_to_dict(self.value)
-                if new_typed_value is not None:
-                    v = new_typed_value
-                    for k in change[0][:-1]:
-                        v = v[k]
-                    v[change[0][-1]] = update
-        if new_typed_value is None:
+                data = None
+            sub_change = [path[1:]] + list(change[1:])
+            branches[name] = apply_changes(data, [sub_change])
+        if branches:
+            # Type change, close pv and open with a new value that only
+            # rebuilds the changed fields
+            self.pv.close()
+            self._open(replace_fields(self.value, branches))
+        else:
             # No type change, post the updated value
+            self._post()
+
+    def _post(self):
+        # type: () -> None
+        # Called with the lock taken
+        delay = self._last_posted + self._min_period - time.time()
+        if delay <= 0:
+            self._last_posted = time.time()
             self.pv.post(self.value)
+        elif not self._post_pending:
+            # Too soon, post everything that has changed by then
+            self._post_pending = True
+            self._post_generation += 1
+            self._start_timer(delay, functools.partial(
+                self._post_later, self._post_generation))
+
+    @staticmethod
+    def _start_timer(delay, callback):
+        # type: (float, Callable[[], None]) -> None
+        # Use a timer rather than sleeping in a spawned function, so throttled
+        # Blocks don't tie up the controller's thread pool
+        cothread = maybe_import_cothread()
+        if cothread and get_thread_ident() == cothread.scheduler_thread_id:
+            cothread.Timer(delay, callback)
         else:
-            # Type change, close pv and open with new value
-            self.pv.close()
-            self._create_initial_value(new_typed_value)
+            timer = threading.Timer(delay, callback)
+            timer.daemon = True
+            timer.start()
+
+    def _post_later(self, generation):
+        # type: (int) -> None
+        with self._lock:
+            if self._post_pending and generation == self._post_generation \
+                    and self.pv and self.pv.isOpen():
+                self._post_pending = False
+                self._last_posted = time.time()
+                self.pv.post(self.value)
+
+    def _update_path(self, path, update):
+        # type: (List[str], Any) -> None
+        # Called with the lock taken
+        key = (tuple(path), type(update))
+        try:
+            setter = self._setters[key]
+        except KeyError:
+            setter = compile_update(self.value, path, update)
+            self._setters[key] = setter
+        setter(update)
 
     # Need camelCase as called by p4p Server
     # noinspection PyPep8Naming
@@ -256,6 +370,8 @@ class BlockHandler(Handler):
         with self._lock:
             self.pv.close()
             self.pv = None
+            # We won't see the Deltas that would tell us the methods changed
+            self._methods.clear()
         request = Unsubscribe()
         request.set_callback(self.handle)
         self.controller.handle_request(request).get(timeout=1)
@@ -264,9 +380,10 @@ class BlockHandler(Handler):
 class PvaServerComms(builtin.controllers.ServerComms):
     """A class for communication between pva client and server"""
 
-    def __init__(self, mri):
-        # type: (builtin.controllers.AMri) -> None
+    def __init__(self, mri, max_rate=0.0):
+        # type: (builtin.controllers.AMri, AMaxRate) -> None
         super(PvaServerComms, self).__init__(mri, use_cothread=True)
+        self.max_rate = max_rate
         self._pva_server = None
         self._provider = None
         self._published = set()
@@ -308,7 +425,7 @@ class PvaServerComms(builtin.controllers.ServerComms):
         else:
             raise NameError("Bad channel %s" % channel_name)
         controller = self.process.get_controller(mri)
-        handler = BlockHandler(controller, field)
+        handler = BlockHandler(controller, field, self.max_rate)
         # We want any client passing a pvRequest field() to ONLY receive that
         # field. The default behaviour of p4p is to send a masked version of
         # the full structure. The mapperMode option allows us to tell p4p to
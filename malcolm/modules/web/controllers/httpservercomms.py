@@ -31,8 +31,8 @@ class HTTPServerComms(builtin.controllers.ServerComms):
         super(HTTPServerComms, self).do_init()
         self._loop = IOLoop()
         part_info = self.run_hooks(
-            ReportHandlersHook(part, self._loop)
-            for part in self.parts.values())
+            ReportHandlersHook(part, self._loop, context)
+            for part, context in self.create_part_contexts().items())
         handler_infos = HandlerInfo.filter_values(part_info)
         handlers = []
         for handler_info in handler_infos:
@@ -1,5 +1,10 @@
+import functools
+import threading
+import time
+
 from annotypes import Anno, TYPE_CHECKING
 from tornado import gen
+from tornado.concurrent import Future
 from tornado.ioloop import IOLoop
 from tornado.websocket import websocket_connect, WebSocketClientConnection
 
@@ -7,19 +12,39 @@ from malcolm.core import Subscribe, deserialize_object, \
     json_decode, json_encode, Response, Error, Update, Return, \
     Queue, TimeoutError, Spawned, Request, StringArrayMeta, Widget, \
     ResponseError, DEFAULT_TIMEOUT, Context, Delta, BlockModel, NTScalar, \
-    BlockMeta, Put, Post
+    BlockMeta, Put, Post, Alarm, serialize_object, Unsubscribe
+from malcolm.compat import OrderedDict
 from malcolm.modules import builtin
+from ..util import CompressionStats, ACompressionLevel, \
+    ACompressionThreshold, compression_options
 
 if TYPE_CHECKING:
-    from typing import Dict, Tuple, Callable
+    from typing import Dict, Tuple, Callable, Any, List, Set
     Key = Tuple[Callable[[Response], None], int]
 
+# Delays between attempts to reconnect to the server, doubling each time
+RECONNECT_MIN_DELAY = 0.1
+RECONNECT_MAX_DELAY = 10.0
+
+
+def differs(a, b):
+    """Whether two serialized values are different"""
+    try:
+        return bool(a != b)
+    except ValueError:
+        # numpy arrays compare elementwise, so are ambiguous
+        return True
+
+
 with Anno("Hostname of malcolm websocket server"):
     AHostname = str
 with Anno("Port number to run up under"):
     APort = int
 with Anno("Time to wait for connection"):
     AConnectTimeout = float
+with Anno("Time to wait for the server to respond to a Put or Post, <0 is "
+          "forever"):
+    ARequestTimeout = float
 
 
 class WebsocketClientComms(builtin.controllers.ClientComms):
@@ -29,43 +54,94 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
                  mri,  # type: builtin.controllers.AMri
                  hostname="localhost",  # type: AHostname
                  port=8080,  # type: APort
-                 connect_timeout=DEFAULT_TIMEOUT  # type: AConnectTimeout
+                 connect_timeout=DEFAULT_TIMEOUT,  # type: AConnectTimeout
+                 compression_level=6,  # type: ACompressionLevel
+                 compression_threshold=1024,  # type: ACompressionThreshold
+                 request_timeout=3600.0,  # type: ARequestTimeout
                  ):
         # type: (...) -> None
         super(WebsocketClientComms, self).__init__(mri, use_cothread=False)
         self.hostname = hostname
         self.port = port
         self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.compression_level = compression_level
+        self.compression_stats = CompressionStats(compression_threshold)
         self.loop = IOLoop()
         self._connected_queue = Queue()
-        self._response_queue = Queue()
+        # {mri: [Response or deferred callback]} waiting to be applied to each
+        # proxy
+        self._pending_responses = {}  # type: Dict[str, List]
+        # mris of proxies that have a worker applying responses
+        self._applying = set()
+        # {mri: Queue} for sync_proxy to wait on the first batch of responses
+        self._sync_queues = {}  # type: Dict[str, Queue]
         self._spawned = None  # type: Spawned
         # {new_id: request}
         self._request_lookup = {}  # type: Dict[int, Request]
         self._next_id = 1
         self._conn = None  # type: WebSocketClientConnection
+        # {path: Subscribe} that should be resent when we reconnect
+        self._subscriptions = OrderedDict()  # type: Dict[Tuple, Subscribe]
+        # {mri: block} of proxies we are keeping in sync
+        self._proxies = OrderedDict()  # type: Dict[str, BlockModel]
+        # {mri: fields} of proxies that only sync some of the remote fields
+        self._proxy_fields = {}  # type: Dict[str, Set[str]]
+        self._disconnected = False
+        # Set when the last health report is done, so the next can wait for it
+        self._health_reported = None  # type: threading.Event
         # Create read-only attribute for the remotely reachable blocks
         self.remote_blocks = StringArrayMeta(
             "Remotely reachable blocks", tags=[Widget.TEXTINPUT.tag()]
         ).create_attribute_model()
         self.field_registry.add_attribute_model(
             "remoteBlocks", self.remote_blocks)
+        self.field_registry.add_attribute_model(
+            "compressionRatio", self.compression_stats.ratio)
+        self.field_registry.add_attribute_model(
+            "compressionTime", self.compression_stats.time)
 
     def do_init(self):
         super(WebsocketClientComms, self).do_init()
         self.start_io_loop()
         root_subscribe = Subscribe(path=[".", "blocks"])
         root_subscribe.set_callback(self._update_remote_blocks)
-        self.loop.add_callback(self._send_request, root_subscribe)
+        self._add_subscription(root_subscribe)
 
     def _update_remote_blocks(self, response):
         response = deserialize_object(response, Update)
         # TODO: should we spawn here?
         self.remote_blocks.set_value(response.value)
 
+    def _add_subscription(self, subscribe):
+        # type: (Subscribe) -> None
+        """Send a Subscribe, and send it again whenever we reconnect. It
+        replaces any previous Subscribe to the same path"""
+        self.loop.add_callback(self._send_subscription, subscribe)
+
+    def _send_subscription(self, subscribe):
+        # type: (Subscribe) -> None
+        # Called in tornado thread, so _on_connect can't be resending the
+        # subscriptions while we change them
+        path = tuple(subscribe.path)
+        old = self._subscriptions.pop(path, None)
+        if old is not None and self._request_lookup.get(old.id) is old:
+            # Server will Return to the old one, then stop sending to it
+            self._write_request(Unsubscribe(old.id))
+        self._subscriptions[path] = subscribe
+        self._send_request(subscribe)
+
+    def _is_subscribed(self, subscribe):
+        # type: (Subscribe) -> bool
+        return self._subscriptions.get(tuple(subscribe.path)) is subscribe
+
     def start_io_loop(self):
         if self._spawned is None:
             self._conn = None
+            self._connected_queue = Queue()
+            # Workers that didn't finish last time won't tell us
+            self._release_deferred()
+            self._applying = set()
             self.loop.add_callback(self.recv_loop)
             self._spawned = self.spawn(self.loop.start)
             try:
@@ -79,28 +155,99 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
             self.loop.stop()
             self._spawned.wait(timeout=10)
             self._spawned = None
+            self._release_deferred()
+
+    def _release_deferred(self):
+        # Called when tornado isn't running. Drop the responses waiting for a
+        # worker, as the proxies will resync when we reconnect, but the Puts
+        # and Posts waiting for them still need their Return or Error
+        pending, self._pending_responses = self._pending_responses, {}
+        for responses in pending.values():
+            for response in responses:
+                if not isinstance(response, Response):
+                    response()
 
     @gen.coroutine
     def recv_loop(self):
         url = "ws://%s:%d/ws" % (self.hostname, self.port)
-        self._conn = yield websocket_connect(
-            url, self.loop, connect_timeout=self.connect_timeout - 0.5)
-        self._connected_queue.put(None)
+        delay = RECONNECT_MIN_DELAY
         while True:
-            message = yield self._conn.read_message()
-            if message is None:
-                for request in self._request_lookup.values():
-                    callback, response = request.error_response(
-                        ResponseError("Server disconnected"))
-                    callback(response)
-                self.spawn(self._report_fault)
-                return
-            self.on_message(message)
-
-    def _report_fault(self):
-        with self._lock:
-            self.transition(self.state_set.FAULT, "Server disconnected")
-            self.stop_io_loop()
+            try:
+                self._conn = yield websocket_connect(
+                    url, self.loop,
+                    connect_timeout=self.connect_timeout - 0.5,
+                    compression_options=compression_options(
+                        self.compression_level))
+            except Exception as e:
+                self.log.debug("Connecting to %s failed: %s", url, e)
+                # Back off so a server that is down isn't hammered
+                yield gen.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            delay = RECONNECT_MIN_DELAY
+            self._on_connect()
+            while True:
+                message = yield self._conn.read_message()
+                if message is None:
+                    break
+                self.on_message(message)
+            self._on_disconnect()
+
+    def _on_connect(self):
+        # Called in tornado thread
+        self._connected_queue.put(None)
+        if self._disconnected:
+            self._disconnected = False
+            self._report_health(self._report_connected)
+        # Any requests from a previous connection are gone, so resubscribe.
+        # Proxies will get a Delta of their whole Block, which will be applied
+        # as a diff to what they already have
+        self._fail_requests()
+        for subscribe in self._subscriptions.values():
+            self._send_request(subscribe)
+
+    def _on_disconnect(self):
+        # Called in tornado thread
+        self._disconnected = True
+        self._conn = None
+        self._fail_requests()
+        self._report_health(self._report_disconnected)
+
+    def _fail_requests(self):
+        # Called in tornado thread. Subscribes are resent when we reconnect,
+        # but anything else will never get a response
+        for request in list(self._request_lookup.values()):
+            if not isinstance(request, Subscribe):
+                callback, response = request.error_response(
+                    ResponseError("Server disconnected"))
+                callback(response)
+        self._request_lookup = {}
+
+    def _report_health(self, func):
+        # Called in tornado thread. Don't block it, but make sure each report
+        # is done after the last so they can't overtake each other
+        last_reported = self._health_reported
+        self._health_reported = threading.Event()
+        self.spawn(self._run_report, func, last_reported,
+                   self._health_reported)
+
+    def _run_report(self, func, last_reported, reported):
+        try:
+            if last_reported:
+                last_reported.wait(DEFAULT_TIMEOUT)
+            func()
+        finally:
+            reported.set()
+
+    def _report_connected(self):
+        self.update_health(self, builtin.infos.HealthInfo(Alarm.ok))
+
+    def _report_disconnected(self):
+        alarm = Alarm.invalid("Server disconnected, reconnecting")
+        self.update_health(self, builtin.infos.HealthInfo(alarm))
+        # Our proxies are now stale until we resubscribe
+        for block in self._proxies.values():
+            block.health.set_value(alarm.message, alarm=alarm)
 
     def do_disable(self):
         super(WebsocketClientComms, self).do_disable()
@@ -127,48 +274,122 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
                     response.message = ResponseError(response.message)
             else:
                 request = self._request_lookup[response.id]
-            # TODO: should we spawn here?
-            request.callback(response)
+            mri = getattr(request, "path", [None])[0]
+            if isinstance(request, (Put, Post)) and mri in self._applying:
+                # Don't let a Put or Post return before the changes it made
+                # to the proxy have been applied
+                self._pending_responses.setdefault(mri, []).append(
+                    functools.partial(request.callback, response))
+            else:
+                # TODO: should we spawn here?
+                request.callback(response)
         except Exception:
             # If we don't catch the exception here, tornado will spew odd
             # error messages about 'HTTPRequest' object has no attribute 'path'
             self.log.exception("on_message(%r) failed", message)
 
-    def sync_proxy(self, mri, block):
+    def sync_proxy(self, mri, block, fields=()):
         """Abstract method telling the ClientComms to sync this proxy Block
         with its remote counterpart. Should wait until it is connected
 
         Args:
             mri (str): The mri for the remote block
             block (BlockModel): The local proxy Block to keep in sync
+            fields (Sequence[str]): If given, only sync these fields of the
+                remote block, as well as health and meta
         """
         # Send a root Subscribe to the server
+        start = time.time()
         subscribe = Subscribe(path=[mri], delta=True)
         done_queue = Queue()
 
         def handle_response(response):
             # type: (Response) -> None
-            self._response_queue.put((response, block))
-            self.spawn(self._handle_response).get()
-            done_queue.put(None)
+            # Called in tornado thread
+            if self._is_subscribed(subscribe):
+                self._queue_response(mri, response)
 
         subscribe.set_callback(handle_response)
-        self.loop.add_callback(self._send_request, subscribe)
-        done_queue.get(timeout=DEFAULT_TIMEOUT)
-
-    def _handle_response(self):
-        with self.changes_squashed:
-            response, block = self._response_queue.get(timeout=0)
-            if not isinstance(response, Delta):
-                # Return or Error is the end of our subscription, log and ignore
-                self.log.debug("Proxy got response %r", response)
-                return
+        self._proxies[mri] = block
+        if fields:
+            # The server still sends everything, but we only apply these
+            self._proxy_fields[mri] = set(fields) | {"health", "meta"}
+        self._sync_queues[mri] = done_queue
+        self._add_subscription(subscribe)
+        self.wait_for_sync(mri, start, done_queue)
+
+    def _queue_response(self, mri, response):
+        # type: (str, Response) -> None
+        """Add a response to the batch for this proxy, starting a worker to
+        apply it if there isn't one already. Called in tornado thread so
+        doesn't need a lock, and never waits for the worker"""
+        self._pending_responses.setdefault(mri, []).append(response)
+        if mri not in self._applying:
+            self._applying.add(mri)
+            self._spawn_apply(mri)
+
+    def _spawn_apply(self, mri):
+        # type: (str) -> None
+        responses = self._pending_responses.pop(mri)
+        self.spawn(self._apply_responses, mri, responses)
+
+    def _apply_responses(self, mri, responses):
+        # type: (str, List[Response]) -> None
+        """Apply a batch of responses to a proxy Block so its subscribers see
+        them as a single change. Called in a worker thread"""
+        block = self._proxies[mri]
+        fields = self._proxy_fields.get(mri)
+        callbacks = []
+        health_reported = self._health_reported
+        if health_reported:
+            # Don't let the disconnected health overwrite a resync
+            health_reported.wait(DEFAULT_TIMEOUT)
+        try:
+            with block.notifier.changes_squashed:
+                for response in responses:
+                    if isinstance(response, Response):
+                        self._handle_response(block, response, fields)
+                    else:
+                        # A deferred Return to a Put or Post
+                        callbacks.append(response)
+            for callback in callbacks:
+                callback()
+        finally:
+            # Tell sync_proxy that the first batch is in
+            done_queue = self._sync_queues.pop(mri, None)
+            if done_queue:
+                done_queue.put(time.time())
+            self.loop.add_callback(self._responses_applied, mri)
+
+    def _responses_applied(self, mri):
+        # type: (str) -> None
+        # Called in tornado thread, apply anything that came in while we were
+        # busy applying the last batch
+        if mri in self._pending_responses:
+            self._spawn_apply(mri)
+        else:
+            self._applying.discard(mri)
+
+    def _handle_response(self, block, response, fields=None):
+        # type: (BlockModel, Response, Set[str]) -> None
+        if not isinstance(response, Delta):
+            # Return or Error is the end of our subscription, log and ignore
+            self.log.debug("Proxy got response %r", response)
+            return
+        try:
             for change in response.changes:
-                try:
+                path = change[0]
+                if fields is None:
                     self._handle_change(block, change)
-                except Exception:
-                    self.log.exception("Error handling %s", response)
-                    raise
+                elif not path:
+                    self._regenerate_block(block, OrderedDict(
+                        (k, v) for k, v in change[1].items()
+                        if k in fields), partial=True)
+                elif path[0] in fields and path != ["meta", "fields"]:
+                    # Our BlockMeta lists the fields we have, not the remote
+                    self._handle_change(block, change)
+        except Exception:
+            self.log.exception("Error handling %s", response)
 
     def _handle_change(self, block, change):
         path = change[0]
@@ -179,16 +400,20 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
         elif len(path) == 1 and path[0] not in ("health", "meta"):
             if len(change) == 1:
                 # Delete a field
-                block.remove_endpoint(path[1])
+                block.remove_endpoint(path[0])
             else:
                 # Change a single field of the block
-                block.set_endpoint_data(path[1], change[1])
+                block.set_endpoint_data(path[0], change[1])
         else:
             block.apply_change(path, *change[1:])
 
-    def _regenerate_block(self, block, d):
+    def _regenerate_block(self, block, d, partial=False):
+        """Make block match the serialized d, only changing the fields that
+        differ so that the Models, and anyone watching them, are kept. If
+        partial then d only has some of the fields of the remote Block, so
+        leave our BlockMeta to list the ones we have"""
         for field in list(block):
-            if field not in ("health", "meta"):
+            if field not in d and field not in ("health", "meta"):
                 block.remove_endpoint(field)
         for field, value in d.items():
             if field == "health":
@@ -202,8 +427,18 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
                 value = deserialize_object(value)  # type: BlockMeta
                 meta = block.meta  # type: BlockMeta
                 for k in meta.call_types:
-                    meta.apply_change([k], value[k])
-            elif field != "typeid":
+                    if not (partial and k == "fields"):
+                        meta.apply_change([k], value[k])
+            elif field == "typeid":
+                continue
+            elif field in block and block[field].typeid == value["typeid"]:
+                # Only apply the parts of the field that have changed
+                model = block[field]
+                for k, v in value.items():
+                    if k != "typeid" and \
+                            differs(serialize_object(model[k]), v):
+                        block.apply_change([field, k], v)
+            else:
                 # No need to set writeable_functions as the server will do it
                 block.set_endpoint_data(field, value)
 
@@ -215,17 +450,8 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
             attribute_name (str): The name of the Attribute within the Block
             value: The value to put
         """
-        q = Queue()
-        request = Put(
-            path=[mri, attribute_name, "value"],
-            value=value)
-        request.set_callback(q.put)
-        self.loop.add_callback(self._send_request, request)
-        response = q.get()
-        if isinstance(response, Error):
-            raise response.message
-        else:
-            return response.value
+        return self._wait_for(
+            self.send_put_async(mri, attribute_name, value))
 
     def send_post(self, mri, method_name, **params):
         """Abstract method to dispatch a Post to the server
@@ -238,23 +464,87 @@ class WebsocketClientComms(builtin.controllers.ClientComms):
         Returns:
             The return results from the server
         """
-        q = Queue()
+        return self._wait_for(self.send_post_async(mri, method_name, params))
+
+    def send_put_async(self, mri, attribute_name, value, get=False):
+        """Dispatch a Put to the server without waiting for the response, so
+        many can be in flight at once
+
+        Args:
+            mri (str): The mri of the Block
+            attribute_name (str): The name of the Attribute within the Block
+            value: The value to put
+            get (bool): Whether the server should return the new value
+
+        Returns:
+            Future: A tornado Future that will resolve to the return value
+        """
+        request = Put(
+            path=[mri, attribute_name, "value"],
+            value=value,
+            get=get)
+        return self._send_request_async(request)
+
+    def send_post_async(self, mri, method_name, params):
+        """Dispatch a Post to the server without waiting for the response, so
+        many can be in flight at once
+
+        Args:
+            mri (str): The mri of the Block
+            method_name (str): The name of the Method within the Block
+            params (dict): The parameters to send
+
+        Returns:
+            Future: A tornado Future that will resolve to the return value
+        """
         request = Post(
             path=[mri, method_name],
             parameters=params)
-        request.set_callback(q.put)
+        return self._send_request_async(request)
+
+    def _send_request_async(self, request):
+        # type: (Request) -> Future
+        future = Future()
+
+        def callback(response):
+            # Called in tornado thread
+            if isinstance(response, Error):
+                future.set_exception(response.message)
+            else:
+                future.set_result(response.value)
+
+        request.set_callback(callback)
         self.loop.add_callback(self._send_request, request)
-        response = q.get()
-        if isinstance(response, Error):
-            raise response.message
+        return future
+
+    def _wait_for(self, future):
+        # type: (Future) -> Any
+        if self.request_timeout < 0:
+            timeout = None
         else:
-            return response.value
+            timeout = self.request_timeout
+        q = Queue()
+        future.add_done_callback(q.put)
+        return q.get(timeout=timeout).result()
 
     def _send_request(self, request):
         # Called in tornado thread
+        if self._conn is None:
+            # Subscribes will be sent when we reconnect, but nothing else
+            # would ever get a response
+            if not isinstance(request, Subscribe):
+                callback, response = request.error_response(
+                    ResponseError("Server disconnected"))
+                callback(response)
+            return
         request.id = self._next_id
         self._next_id += 1
         self._request_lookup[request.id] = request
+        self._write_request(request)
+
+    def _write_request(self, request):
+        # type: (Request) -> None
+        # Called in tornado thread
         message = json_encode(request)
         self.log.debug("Sending message %s", message)
-        self._conn.write_message(message)
+        self.compression_stats.write_message(self._conn.protocol, message)
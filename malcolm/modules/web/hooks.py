@@ -2,7 +2,7 @@ from annotypes import Anno, Array, Sequence, Union
 from tornado.ioloop import IOLoop
 
 from malcolm.core import Hook, APublished
-from malcolm.modules.builtin.hooks import APart
+from malcolm.modules.builtin.hooks import APart, AContext
 from .infos import HandlerInfo
 
 with Anno("The IO loop that the server is running under"):
@@ -15,9 +15,10 @@ UHandlerInfos = Union[AHandlerInfos, Sequence[HandlerInfo], HandlerInfo, None]
 class ReportHandlersHook(Hook):
     """Called at init() to get all the handlers that should make the application
     """
-    def __init__(self, part, loop):
-        # type: (APart, ALoop) -> None
-        super(ReportHandlersHook, self).__init__(part, loop=loop)
+    def __init__(self, part, loop, context=None):
+        # type: (APart, ALoop, AContext) -> None
+        super(ReportHandlersHook, self).__init__(
+            part, loop=loop, context=context)
 
     def validate_return(self, ret):
         # type: (UHandlerInfos) -> AHandlerInfos
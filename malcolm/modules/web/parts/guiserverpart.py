@@ -1,4 +1,6 @@
+import mimetypes
 import os
+import re
 
 from annotypes import Anno, add_call_types
 from tornado.web import StaticFileHandler, RedirectHandler
@@ -10,13 +12,80 @@ from ..infos import HandlerInfo
 
 www_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "www"))
 
+# The malcolmjs build puts a content hash in the names of files that will never
+# change, like main.2f20520f.js or 5b9c390c8e3f9a3c7aeb.worker.js
+HASHED_RE = re.compile(r"(^|\.)[0-9a-f]{8,20}\.")
+
+
+def accepts_gzip(accept_encoding):
+    # type: (str) -> bool
+    """Whether an Accept-Encoding header allows gzip. Codings are matched
+    whole, so x-gzip doesn't count, and q=0 means not acceptable"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        params = item.split(";")
+        q = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[params[0].strip().lower()] = q
+    # * matches any coding not listed
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
 
 with Anno("Path to www directory to get files from"):
     APath = str
 
 
+class GuiStaticFileHandler(StaticFileHandler):
+    """Serve the gzipped version of a file if there is one next to it and the
+    client accepts it, and let the client cache hashed files forever"""
+    gzipped = False
+
+    def validate_absolute_path(self, root, absolute_path):
+        absolute_path = super(GuiStaticFileHandler, self).\
+            validate_absolute_path(root, absolute_path)
+        if absolute_path and os.path.isfile(absolute_path + ".gz"):
+            # Whether we send the gzipped version or not, caches need to know
+            # that the response depends on Accept-Encoding
+            self.set_header("Vary", "Accept-Encoding")
+            if accepts_gzip(self.request.headers.get("Accept-Encoding", "")):
+                self.gzipped = True
+                absolute_path += ".gz"
+        return absolute_path
+
+    def get_content_type(self):
+        if self.gzipped:
+            # Content-Type is that of the uncompressed file
+            mime_type, _ = mimetypes.guess_type(self.absolute_path[:-3])
+            return mime_type or "application/octet-stream"
+        else:
+            return super(GuiStaticFileHandler, self).get_content_type()
+
+    def get_cache_time(self, path, modified, mime_type):
+        if HASHED_RE.search(os.path.basename(path)):
+            return self.CACHE_MAX_AGE
+        else:
+            return 0
+
+    def set_extra_headers(self, path):
+        if self.gzipped:
+            self.set_header("Content-Encoding", "gzip")
+        if HASHED_RE.search(os.path.basename(path)):
+            self.set_header("Cache-Control", "public, max-age=%d, immutable" %
+                            self.CACHE_MAX_AGE)
+        else:
+            # index.html, service-worker.js, etc. must be checked every time
+            # so clients pick up a new build, Etag makes this cheap
+            self.set_header("Cache-Control", "no-cache")
+
+
 # Always serve index.html, no matter what the route
-class IndexHandler(StaticFileHandler):
+class IndexHandler(GuiStaticFileHandler):
     @classmethod
     def get_absolute_path(cls, root, path):
         return super(IndexHandler, cls).get_absolute_path(root, "index.html")
@@ -42,6 +111,6 @@ class GuiServerPart(Part):
             # Serve index.html for /gui or /details
             HandlerInfo(r"/(gui|details).*", self.GuiHandler, path=self.path),
             # Anything else should be a static file handle
-            HandlerInfo(r"/(.*)", StaticFileHandler, path=self.path)
+            HandlerInfo(r"/(.*)", GuiStaticFileHandler, path=self.path)
         ]
         return infos
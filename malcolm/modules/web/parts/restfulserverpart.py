@@ -1,11 +1,23 @@
-from annotypes import Anno, add_call_types
-from tornado.web import RequestHandler, asynchronous
+import json
 
+from annotypes import Anno, add_call_types, TYPE_CHECKING
+from tornado.ioloop import PeriodicCallback
+from tornado.web import RequestHandler, asynchronous, HTTPError
+
+from malcolm.compat import OrderedDict, str_
 from malcolm.core import Part, json_decode, json_encode, Get, Post, Return, \
-    Error
+    Error, Subscribe, Unsubscribe, Delta
 from malcolm.modules import builtin
-from ..hooks import ReportHandlersHook, ALoop, UHandlerInfos
+from ..hooks import ReportHandlersHook, ALoop, UHandlerInfos, AContext
 from ..infos import HandlerInfo
+from ..util import merge_changes
+
+if TYPE_CHECKING:
+    from typing import List, Optional
+    from malcolm.core import Context
+
+# Time between comments sent to keep idle event streams open
+KEEPALIVE_PERIOD = 15.0
 
 
 # For some reason tornado doesn't make us implement all abstract methods
@@ -22,6 +34,15 @@ class RestfulHandler(RequestHandler):
     def get(self, endpoint_str):
         # called from tornado thread
         path = endpoint_str.split("/")
+        etag = self._server_part.get_etag(path)
+        if etag:
+            self.set_header("Etag", etag)
+            if self.check_etag_header():
+                # Nothing has changed since the client last asked, so don't
+                # bother serializing it again
+                self.set_status(304)
+                self.finish()
+                return
         request = Get(path=path)
         request.set_callback(self.on_response)
         self._server_part.on_request(request)
@@ -55,6 +76,191 @@ class RestfulHandler(RequestHandler):
         self._server_part.on_request(request)
 
 
+# curl --data '["hello/greet", {"path": "hello/greet", \
+#     "parameters": {"name": "me"}}]' http://localhost:8080/rest
+# noinspection PyAbstractClass
+class BatchHandler(RequestHandler):
+    """Handle a list of Gets and Posts in a single HTTP request, dispatching
+    them all at once and returning a JSON object of results keyed by path"""
+    _server_part = None
+    _loop = None
+
+    def initialize(self, server_part=None, loop=None):
+        self._server_part = server_part
+        self._loop = loop
+        # {path_str: value or serialized Error}
+        self._results = OrderedDict()
+        self._outstanding = 0
+
+    @asynchronous
+    def get(self):
+        # called from tornado thread
+        self.handle_requests(self.get_query_arguments("path"))
+
+    @asynchronous
+    def post(self):
+        # called from tornado thread
+        try:
+            items = json.loads(self.request.body.decode(),
+                               object_pairs_hook=OrderedDict)
+            assert isinstance(items, list), "Expected a list, got %r" % items
+        except Exception as e:
+            raise HTTPError(400, "Bad batch request: %s" % e)
+        self.handle_requests(items)
+
+    def handle_requests(self, items):
+        """Make a Get for every path string, and a Post for every dict of
+        path and parameters. Each path may only appear once, as results are
+        keyed by path"""
+        requests = []
+        for item in items:
+            if isinstance(item, str_):
+                path_str = item
+                request = Get(path=path_str.split("/"))
+            elif isinstance(item, dict) and \
+                    isinstance(item.get("path", None), str_) and \
+                    isinstance(item.get("parameters", {}), dict):
+                path_str = item["path"]
+                request = Post(path=path_str.split("/"),
+                               parameters=item.get("parameters", {}))
+            else:
+                raise HTTPError(
+                    400, "Bad batch item %r, expected a path string or an "
+                         "object with path and parameters" % (item,))
+            if path_str in self._results:
+                raise HTTPError(
+                    400, "Path %r appears more than once in batch" % path_str)
+            self._results[path_str] = None
+            request.set_callback(
+                lambda response, k=path_str: self.on_response(k, response))
+            requests.append(request)
+        self._outstanding = len(requests)
+        if not requests:
+            self.finish(json_encode(self._results) + "\n")
+        for request in requests:
+            try:
+                self._server_part.on_request(request)
+            except Exception as e:
+                # One bad path shouldn't stop us answering the rest
+                cb, response = request.error_response(e)
+                cb(response)
+
+    def on_response(self, path_str, response):
+        # called from any thread
+        self._loop.add_callback(self._on_response, path_str, response)
+
+    def _on_response(self, path_str, response):
+        # called from tornado thread
+        if isinstance(response, Return):
+            self._results[path_str] = response.value
+        elif isinstance(response, Error):
+            self._results[path_str] = response
+        else:
+            # Only expect one response for each Get or Post
+            return
+        self._outstanding -= 1
+        if self._outstanding == 0:
+            self.finish(json_encode(self._results) + "\n")
+
+
+# curl http://localhost:8080/rest_events/hello/greet?max_rate=2
+# noinspection PyAbstractClass
+class EventStreamHandler(RequestHandler):
+    """Stream the Deltas of a Subscribe to a path as Server-Sent Events, with
+    an optional max_rate query argument limiting the events per second"""
+    _server_part = None
+    _loop = None
+
+    def initialize(self, server_part=None, loop=None):
+        self._server_part = server_part
+        self._loop = loop
+        self._subscribe = None  # type: Subscribe
+        self._keepalive = None  # type: PeriodicCallback
+        # Changes waiting to be sent because of max_rate
+        self._pending = []
+        self._min_period = 0.0
+        self._last_sent = 0.0
+        self._timeout = None
+
+    @asynchronous
+    def get(self, endpoint_str):
+        # called from tornado thread
+        try:
+            max_rate = float(self.get_query_argument("max_rate", 0))
+        except ValueError as e:
+            raise HTTPError(400, "Bad max_rate: %s" % e)
+        if max_rate > 0:
+            self._min_period = 1.0 / max_rate
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        self.flush()
+        self._keepalive = PeriodicCallback(
+            self.send_keepalive, KEEPALIVE_PERIOD * 1000)
+        self._keepalive.start()
+        self._subscribe = Subscribe(path=endpoint_str.split("/"), delta=True)
+        self._subscribe.set_callback(self.on_response)
+        try:
+            self._server_part.on_request(self._subscribe)
+        except Exception as e:
+            cb, response = self._subscribe.error_response(e)
+            self._on_response(response)
+
+    def on_response(self, response):
+        # called from any thread
+        self._loop.add_callback(self._on_response, response)
+
+    def _on_response(self, response):
+        # called from tornado thread
+        if self._subscribe is None:
+            # Already unsubscribed, so nothing more to send
+            return
+        if isinstance(response, Delta):
+            self._pending = merge_changes(self._pending, response.changes)
+            delay = self._last_sent + self._min_period - self._loop.time()
+            if delay <= 0:
+                self.send_pending()
+            elif self._timeout is None:
+                self._timeout = self._loop.call_later(delay, self.send_pending)
+        elif isinstance(response, Error):
+            # The Subscribe has failed, so there is nothing to unsubscribe
+            self._subscribe = None
+            self.close_stream()
+            self.write("event: error\ndata: %s\n\n" % json_encode(
+                response.message))
+            self.finish()
+
+    def send_pending(self):
+        self._timeout = None
+        self._last_sent = self._loop.time()
+        if self._pending:
+            self.write("data: %s\n\n" % json_encode(self._pending))
+            self._pending = []
+            self.flush()
+
+    def send_keepalive(self):
+        # A comment line, ignored by clients
+        self.write(":\n\n")
+        self.flush()
+
+    def close_stream(self):
+        if self._keepalive:
+            self._keepalive.stop()
+            self._keepalive = None
+        if self._timeout is not None:
+            self._loop.remove_timeout(self._timeout)
+            self._timeout = None
+        if self._subscribe:
+            mri = self._subscribe.path[0]
+            unsubscribe = Unsubscribe(self._subscribe.id)
+            unsubscribe.set_callback(self._subscribe.callback)
+            self._subscribe = None
+            self._server_part.on_request(unsubscribe, mri)
+
+    def on_connection_close(self):
+        # called from tornado thread when the client disconnects
+        self.close_stream()
+
+
 with Anno("Part name and subdomain name to respond to queries on"):
     AName = str
 
@@ -63,18 +269,41 @@ class RestfulServerPart(Part):
     def __init__(self, name="rest"):
         # type: (AName) -> None
         super(RestfulServerPart, self).__init__(name)
+        self._context = None  # type: Context
         # Hooks
         self.register_hooked(ReportHandlersHook, self.report_handlers)
 
     @add_call_types
-    def report_handlers(self, loop):
-        # type: (ALoop) -> UHandlerInfos
-        regexp = r"/%s/(.*)" % self.name
-        info = HandlerInfo(
-            regexp, RestfulHandler, server_part=self, loop=loop)
-        return info
-
-    def on_request(self, request):
+    def report_handlers(self, loop, context=None):
+        # type: (ALoop, AContext) -> UHandlerInfos
+        self._context = context
+        # The batch handler must come first so it gets the bare path
+        infos = [
+            HandlerInfo(r"/%s/?" % self.name, BatchHandler,
+                        server_part=self, loop=loop),
+            HandlerInfo(r"/%s/(.*)" % self.name, RestfulHandler,
+                        server_part=self, loop=loop),
+            HandlerInfo(r"/%s_events/(.*)" % self.name, EventStreamHandler,
+                        server_part=self, loop=loop)
+        ]
+        return infos
+
+    def get_etag(self, path):
+        # type: (List[str]) -> Optional[str]
+        """Make an ETag from the change generation of the Model at path, or
+        None if it can't be found"""
+        if self._context is None:
+            return None
+        try:
+            controller = self._context.get_controller(path[0])
+            generation = controller.get_generation(path)
+        except Exception:
+            # Let the Get produce the error
+            return None
+        return '"%d"' % generation
+
+    def on_request(self, request, mri=None):
         # called from tornado thread
-        mri = request.path[0]
+        if mri is None:
+            mri = request.path[0]
         self.registrar.report(builtin.infos.RequestInfo(request, mri))
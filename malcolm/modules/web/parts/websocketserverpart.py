@@ -1,12 +1,80 @@
-from annotypes import Anno, add_call_types
-from tornado.websocket import WebSocketHandler, WebSocketError
+import functools
+from threading import Lock
 
+from annotypes import Anno, add_call_types, TYPE_CHECKING
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketHandler, WebSocketError, \
+    WebSocketClosedError
+
+from malcolm.compat import OrderedDict
 from malcolm.core import Part, json_decode, deserialize_object, Request, PathRequest,\
-    json_encode, Subscribe, Unsubscribe, Delta, Update, Error, Response, FieldError
+    json_encode, Subscribe, Unsubscribe, Delta, Update, Error, Response, \
+    FieldError, Alarm, AlarmSeverity, AlarmStatus, PartRegistrar, apply_changes
 from malcolm.modules import builtin
 from ..infos import HandlerInfo
 from ..hooks import ReportHandlersHook, ALoop, UHandlerInfos, PublishHook, \
     APublished
+from ..util import CompressionStats, ACompressionLevel, \
+    ACompressionThreshold, compression_options, AJsonWorkers, OrderedWorkers, \
+    IOLoopLag, merge_changes
+
+if TYPE_CHECKING:
+    from typing import Callable
+
+# Number of responses that can be encoding in the workers for a single client
+# before any more are queued and merged
+MAX_ENCODING = 8
+
+
+class SharedSubscription(object):
+    """A single Subscribe to a Block, the responses of which are sent to every
+    websocket client subscribed to the same path"""
+    def __init__(self, request):
+        # type: (Subscribe) -> None
+        self.request = request
+        # {(websocket, client_id): None} in order of subscription
+        self.clients = OrderedDict()
+        # The serialized value of the subscribed path, None until the
+        # first response
+        self.value = None
+        self.has_value = False
+
+    def initial_response(self, client_id):
+        # type: (int) -> Response
+        if self.request.delta:
+            return Delta(client_id, [[[], self.value]])
+        else:
+            return Update(client_id, self.value)
+
+    def update_value(self, response):
+        # type: (Response) -> None
+        if isinstance(response, Delta):
+            self.value = apply_changes(self.value, response.changes)
+            self.has_value = True
+        elif isinstance(response, Update):
+            self.value = response.value
+            self.has_value = True
+
+
+class EncodeOnce(object):
+    """Encode a Response to JSON the first time any client needs it, so that
+    it can be sent to many clients with their own ids. Called in worker
+    threads"""
+    def __init__(self, response):
+        # type: (Response) -> None
+        self.response = response
+        self._lock = Lock()
+        self._prefix = None
+        self._suffix = None
+
+    def with_id(self, client_id):
+        # type: (int) -> str
+        with self._lock:
+            if self._prefix is None:
+                message = json_encode(self.response)
+                id_field = '"id": %d' % self.response.id
+                self._prefix, self._suffix = message.split(id_field, 1)
+        return '%s"id": %d%s' % (self._prefix, client_id, self._suffix)
 
 
 # For some reason tornado doesn't make us implement all abstract methods
@@ -14,13 +82,32 @@ from ..hooks import ReportHandlersHook, ALoop, UHandlerInfos, PublishHook, \
 class MalcWebSocketHandler(WebSocketHandler):
     _server_part = None
     _loop = None
+    _high_water_mark = 0
+    # Bytes passed to tornado that haven't been written to the socket yet
+    _buffered_bytes = 0
+    # Number of responses passed to the workers that haven't been encoded yet
+    _encoding = 0
+    # True while _write_queued is writing, so it isn't called recursively when
+    # the workers encode in tornado's thread
+    _writing_queued = False
+    # {key: Response} waiting to be sent when the buffer drains
+    _queue = None
+    _closed = False
 
-    def initialize(self, server_part=None, loop=None):
+    def initialize(self, server_part=None, loop=None, high_water_mark=0):
         self._server_part = server_part
         self._loop = loop
+        self._high_water_mark = high_water_mark
+        self._queue = OrderedDict()
+        self._next_key = 0
 
     def on_message(self, message):
         # called in tornado's thread
+        self._server_part.workers.run(
+            (self, "decode"), self._on_decoded, self._decode, message)
+
+    def _decode(self, message):
+        # called in a worker thread, or tornado's if there are no workers
         msg_id = -1
         try:
             d = json_decode(message)
@@ -30,21 +117,134 @@ class MalcWebSocketHandler(WebSocketHandler):
             except KeyError:
                 raise FieldError('id field not present in JSON message')
 
-            request = deserialize_object(d, Request)
-            request.set_callback(self.on_response)
-            self._server_part.on_request(request)
-
+            return deserialize_object(d, Request)
         except Exception as e:
-            self._server_part.log.exception("Error handling message from client")
-            error = Error(msg_id, e)
-            error_message = error.to_dict()
-            self.write_message(json_encode(error_message))
+            self._server_part.log.exception(
+                "Error decoding message from client")
+            return Error(msg_id, e)
+
+    def _on_decoded(self, request):
+        # called in tornado's thread
+        if self._closed:
+            # Closed while we were decoding
+            return
+        elif isinstance(request, Exception):
+            # The worker failed unexpectedly
+            request = Error(-1, request)
+        elif isinstance(request, Request):
+            try:
+                request.set_callback(self.on_response)
+                self._server_part.on_request(request, self)
+                return
+            except Exception as e:
+                self._server_part.log.exception(
+                    "Error handling message from client")
+                request = Error(request.id, e)
+        self._write_response(request)
 
     def on_response(self, response):
         # called from any thread
         self._loop.add_callback(
             self._server_part.on_response, response, self)
 
+    def get_compression_options(self):
+        return compression_options(self._server_part.compression_level)
+
+    def write_message(self, message, binary=False):
+        # called in tornado's thread
+        if self.ws_connection is None:
+            raise WebSocketClosedError()
+        return self._server_part.compression_stats.write_message(
+            self.ws_connection, message)
+
+    def on_close(self):
+        # called in tornado's thread
+        self._closed = True
+        self._queue.clear()
+        self._server_part.on_close(self)
+
+    def send_response(self, response, encode=None):
+        # type: (Response, Callable[[], str]) -> None
+        """Write the response to the websocket, or if the client isn't keeping
+        up then queue it, merging it with any queued response to the same
+        subscription. If encode is given it should return the encoded
+        response"""
+        # called in tornado's thread
+        if self._queue or self._encoding >= MAX_ENCODING or \
+                self._buffered_bytes > self._high_water_mark:
+            self._queue_response(response)
+            self._server_part.set_stalled(self, True)
+        else:
+            self._write_response(response, encode)
+
+    def _queue_response(self, response):
+        # type: (Response) -> None
+        if isinstance(response, (Delta, Update)):
+            key = response.id
+            queued = self._queue.get(key, None)
+            if isinstance(queued, Delta) and isinstance(response, Delta):
+                # Don't modify the changes in place, they may be shared with
+                # other subscribers
+                response = Delta(response.id, merge_changes(
+                    queued.changes, response.changes))
+            # If queued, this keeps the original position in the queue
+            self._queue[key] = response
+        else:
+            # Return or Error must come after anything already queued
+            self._queue[("once", self._next_key)] = response
+            self._next_key += 1
+
+    def _write_response(self, response, encode=None):
+        # type: (Response, Callable[[], str]) -> None
+        # Encode in a worker, writing in order with everything else sent to
+        # this client
+        if encode is None:
+            encode = functools.partial(json_encode, response)
+        self._encoding += 1
+        self._server_part.workers.run(
+            self, functools.partial(self._write_message, response), encode)
+
+    def _write_message(self, response, message):
+        # type: (Response, str) -> None
+        # called in tornado's thread
+        self._encoding -= 1
+        if self._closed:
+            # Closed while we were encoding
+            return
+        if isinstance(message, Exception):
+            # The worker couldn't encode it, so tell the client why
+            message = json_encode(Error(response.id, message))
+        try:
+            future = self.write_message(message)
+        except WebSocketError:
+            self._server_part.on_websocket_error(response, self)
+            return
+        if future is not None:
+            # Keep count of how much is waiting to go out on the socket
+            nbytes = len(message)
+            self._buffered_bytes += nbytes
+            future.add_done_callback(lambda f: self._on_flushed(nbytes))
+        self._write_queued()
+
+    def _on_flushed(self, nbytes):
+        # called in tornado's thread
+        self._buffered_bytes -= nbytes
+        self._write_queued()
+
+    def _write_queued(self):
+        # called in tornado's thread
+        if self._writing_queued:
+            return
+        self._writing_queued = True
+        try:
+            while self._queue and self._encoding < MAX_ENCODING and \
+                    self._buffered_bytes <= self._high_water_mark:
+                self._write_response(self._queue.pop(next(iter(self._queue))))
+        finally:
+            self._writing_queued = False
+        if not self._queue:
+            self._server_part.set_stalled(self, False)
+
     # http://stackoverflow.com/q/24851207
     # TODO: remove this when the web gui is hosted from the box
     def check_origin(self, origin):
@@ -53,28 +253,72 @@ class MalcWebSocketHandler(WebSocketHandler):
 
 with Anno("Part name and subdomain name to host websocket on"):
     AName = str
+with Anno("Number of bytes waiting to be sent to a websocket client before "
+          "responses are queued and merged"):
+    AHighWaterMark = int
 
 
 class WebsocketServerPart(Part):
-    def __init__(self, name="ws"):
-        # type: (AName) -> None
+    def __init__(self,
+                 name="ws",  # type: AName
+                 high_water_mark=1000000,  # type: AHighWaterMark
+                 compression_level=6,  # type: ACompressionLevel
+                 compression_threshold=1024,  # type: ACompressionThreshold
+                 json_workers=2,  # type: AJsonWorkers
+                 ):
+        # type: (...) -> None
         super(WebsocketServerPart, self).__init__(name)
-        # {id: Subscribe}
+        self.high_water_mark = high_water_mark
+        self.compression_level = compression_level
+        self.compression_stats = CompressionStats(compression_threshold)
+        self.workers = OrderedWorkers(json_workers)
+        self.loop_lag = IOLoopLag()
+        # {(callback, id): Subscribe} of client subscriptions
         self._subscription_keys = {}
+        # {(path, delta): SharedSubscription} for subscriptions to Blocks
+        self._shared = {}
+        self._next_shared_id = 0
+        self._loop = None  # type: IOLoop
         # [mri]
         self._published = []
+        # Websockets that have more than high_water_mark bytes buffered
+        self._stalled = set()
         # Hooks
         self.register_hooked(ReportHandlersHook, self.report_handlers)
         self.register_hooked(PublishHook, self.publish)
+        self.register_hooked(builtin.hooks.DisableHook, self.disable)
+        self.register_hooked(builtin.hooks.ResetHook, self.reset)
+
+    def setup(self, registrar):
+        # type: (PartRegistrar) -> None
+        super(WebsocketServerPart, self).setup(registrar)
+        registrar.add_attribute_model(
+            "compressionRatio", self.compression_stats.ratio)
+        registrar.add_attribute_model(
+            "compressionTime", self.compression_stats.time)
+        registrar.add_attribute_model("ioLoopLag", self.loop_lag.lag)
 
     @add_call_types
     def report_handlers(self, loop):
         # type: (ALoop) -> UHandlerInfos
+        self._loop = loop
+        self.reset()
         regexp = r"/%s" % self.name
         info = HandlerInfo(
-            regexp, MalcWebSocketHandler, server_part=self, loop=loop)
+            regexp, MalcWebSocketHandler, server_part=self, loop=loop,
+            high_water_mark=self.high_water_mark)
         return info
 
+    def reset(self):
+        # type: () -> None
+        self.workers.start(self._loop)
+        self.loop_lag.start(self._loop)
+
+    def disable(self):
+        # type: () -> None
+        self.loop_lag.stop()
+        self.workers.stop()
+
     @add_call_types
     def publish(self, published):
         # type: (APublished) -> None
@@ -84,8 +328,8 @@ class WebsocketServerPart(Part):
             if request.path[0] == ".":
                 self._notify_published(request)
 
-    def on_request(self, request):
-        # type: (Request) -> None
+    def on_request(self, request, websocket):
+        # type: (Request, MalcWebSocketHandler) -> None
         # called from tornado thread
         if isinstance(request, PathRequest):
             if not request.path:
@@ -99,45 +343,131 @@ class WebsocketServerPart(Part):
                 assert len(request.path) == 2 and request.path[1] == "blocks", \
                     "Don't know how to subscribe to %s" % (request.path,)
                 self._notify_published(request)
+            else:
+                self._add_shared_client(request, websocket)
             self._subscription_keys[request.generate_key()] = request
-            if request.path[0] == ".":
-                return
-
-        if isinstance(request, Unsubscribe):
+        elif isinstance(request, Unsubscribe):
             subscribe = self._subscription_keys.pop(request.generate_key())
-            mri = subscribe.path[0]
-            if mri == ".":
-                # service requests on ourself
-                response, cb = subscribe.return_response()
-                cb(response)
-                return
+            if subscribe.path[0] != ".":
+                self._remove_shared_client(subscribe, websocket)
+            cb, response = subscribe.return_response()
+            cb(response)
         else:
             mri = request.path[0]
-        self.registrar.report(builtin.infos.RequestInfo(request, mri))
+            self.registrar.report(builtin.infos.RequestInfo(request, mri))
+
+    def _add_shared_client(self, request, websocket):
+        # type: (Subscribe, MalcWebSocketHandler) -> None
+        key = (tuple(request.path), request.delta)
+        shared = self._shared.get(key, None)
+        if shared is None:
+            # First client for this path, so subscribe to the Block
+            upstream = Subscribe(
+                self._next_shared_id, list(request.path), request.delta)
+            self._next_shared_id += 1
+            shared = SharedSubscription(upstream)
+            self._shared[key] = shared
+            upstream.set_callback(
+                lambda response: self._loop.add_callback(
+                    self._on_shared_response, shared, response))
+            shared.clients[(websocket, request.id)] = None
+            self.registrar.report(builtin.infos.RequestInfo(
+                upstream, request.path[0]))
+        else:
+            shared.clients[(websocket, request.id)] = None
+            if shared.has_value:
+                # Others will have already had the initial value, so send
+                # this client the current state
+                self.on_response(
+                    shared.initial_response(request.id), websocket)
+
+    def _remove_shared_client(self, request, websocket):
+        # type: (Subscribe, MalcWebSocketHandler) -> None
+        key = (tuple(request.path), request.delta)
+        shared = self._shared.get(key, None)
+        if shared is not None:
+            shared.clients.pop((websocket, request.id), None)
+            if not shared.clients:
+                # Last one out, so unsubscribe from the Block
+                del self._shared[key]
+                unsubscribe = Unsubscribe(shared.request.id)
+                unsubscribe.set_callback(shared.request.callback)
+                self.registrar.report(builtin.infos.RequestInfo(
+                    unsubscribe, request.path[0]))
+
+    def _on_shared_response(self, shared, response):
+        # type: (SharedSubscription, Response) -> None
+        # called from tornado thread
+        key = (tuple(shared.request.path), shared.request.delta)
+        if self._shared.get(key, None) is not shared:
+            # Unsubscribed, so this is the Return from the Block
+            return
+        shared.update_value(response)
+        if not isinstance(response, (Delta, Update)):
+            # Return or Error means the subscription is finished
+            del self._shared[key]
+        # Encode the response once, then splice in each client's id
+        encoded = EncodeOnce(response)
+        response_cls = type(response)
+        args = [getattr(response, k) for k in response.call_types if k != "id"]
+        for websocket, client_id in list(shared.clients):
+            client_response = response_cls(client_id, *args)
+            client_encode = functools.partial(encoded.with_id, client_id)
+            if key not in self._shared:
+                self._subscription_keys.pop(
+                    (websocket.on_response, client_id), None)
+            websocket.send_response(client_response, client_encode)
 
     def on_response(self, response, websocket):
         # type: (Response, MalcWebSocketHandler) -> None
         # called from tornado thread
-        message = json_encode(response)
-        try:
-            websocket.write_message(message)
-        except WebSocketError:
-            # The websocket is dead. If the response was a Delta or Update, then
-            # unsubscribe so the local controller doesn't keep on trying to
-            # respond
-            if isinstance(response, (Delta, Update)):
-                # Websocket is dead so we can clear the subscription key.
-                # Subsequent updates may come in before the unsubscribe, but
-                # ignore them as we can't do anything about it
-                subscribe = self._subscription_keys.pop(
-                    (websocket.on_response, response.id), None)
-                if subscribe:
-                    self.log.info(
-                        'WebSocket Error; unsubscribing from stale handle')
-                    unsubscribe = Unsubscribe(response.id)
-                    unsubscribe.set_callback(websocket.on_response)
-                    self.registrar.report(builtin.infos.RequestInfo(
-                        unsubscribe, subscribe.path[0]))
+        websocket.send_response(response)
+
+    def on_websocket_error(self, response, websocket):
+        # type: (Response, MalcWebSocketHandler) -> None
+        # called from tornado thread
+        # The websocket is dead. If the response was a Delta or Update, then
+        # unsubscribe so the local controller doesn't keep on trying to
+        # respond
+        if isinstance(response, (Delta, Update)):
+            # Websocket is dead so we can clear the subscription key.
+            # Subsequent updates may come in before the unsubscribe, but
+            # ignore them as we can't do anything about it
+            subscribe = self._subscription_keys.pop(
+                (websocket.on_response, response.id), None)
+            if subscribe and subscribe.path[0] != ".":
+                self.log.info(
+                    'WebSocket Error; unsubscribing from stale handle')
+                self._remove_shared_client(subscribe, websocket)
+
+    def on_close(self, websocket):
+        # type: (MalcWebSocketHandler) -> None
+        # called from tornado thread
+        self.set_stalled(websocket, False)
+        for key, subscribe in list(self._subscription_keys.items()):
+            if key[0] == websocket.on_response:
+                self._subscription_keys.pop(key)
+                if subscribe.path[0] != ".":
+                    self._remove_shared_client(subscribe, websocket)
+
+    def set_stalled(self, websocket, stalled):
+        # type: (MalcWebSocketHandler, bool) -> None
+        # called from tornado thread
+        if stalled == (websocket in self._stalled):
+            return
+        if stalled:
+            self.log.warning("Websocket client not keeping up, merging deltas")
+            self._stalled.add(websocket)
+        else:
+            self._stalled.discard(websocket)
+        if self._stalled:
+            alarm = Alarm(
+                AlarmSeverity.MINOR_ALARM, AlarmStatus.CLIENT_STATUS,
+                "%d websocket client(s) not keeping up with updates" %
+                len(self._stalled))
+        else:
+            alarm = Alarm.ok
+        self.registrar.report(builtin.infos.HealthInfo(alarm))
 
     def _notify_published(self, request):
         # type: (Subscribe) -> None
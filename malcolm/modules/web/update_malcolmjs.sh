@@ -12,5 +12,11 @@ rm -rf $HERE/www
 mkdir $HERE/www
 wget -O $TMP $RELEASE
 tar -C $HERE/www -zxf $TMP
+# Precompress text files so GuiServerPart can serve them without gzipping
+# on every request, -n so the output only changes when the input does.
+# Sourcemaps are only fetched by developer tools, so aren't worth storing twice
+find $HERE/www -type f \( -name '*.html' -o -name '*.js' -o -name '*.css' \
+    -o -name '*.json' -o -name '*.ico' \) \
+    -exec gzip -9 -n -k {} \;
 git add $HERE/www
 
@@ -0,0 +1,241 @@
+import logging
+import time
+from multiprocessing.pool import ThreadPool
+
+from annotypes import Anno, TYPE_CHECKING
+from tornado.escape import utf8
+
+from malcolm.core import NumberMeta, Widget
+
+if TYPE_CHECKING:
+    from tornado.ioloop import IOLoop
+
+# Create a module level logger
+log = logging.getLogger(__name__)
+
+with Anno("The zlib compression level to offer for permessage-deflate, "
+          "0 to disable compression"):
+    ACompressionLevel = int
+with Anno("Messages shorter than this many bytes are sent uncompressed"):
+    ACompressionThreshold = int
+with Anno("Number of threads to encode and decode JSON messages in, 0 to do "
+          "it in the IOLoop"):
+    AJsonWorkers = int
+
+# Minimum time between updates of the compression metric attributes
+METRICS_PERIOD = 1.0
+
+
+def compression_options(compression_level):
+    # type: (int) -> dict
+    """Make the tornado compression_options for a given compression level"""
+    if compression_level > 0:
+        return dict(compression_level=compression_level)
+
+
+def merge_changes(old_changes, new_changes):
+    """Merge two lists of Delta changes into a single list that produces the
+    same result, dropping any old change that a new change overwrites"""
+    new_paths = [tuple(change[0]) for change in new_changes]
+    merged = []
+    for change in old_changes:
+        path = tuple(change[0])
+        if not any(path[:len(p)] == p for p in new_paths):
+            merged.append(change)
+    return merged + list(new_changes)
+
+
+class CompressionStats(object):
+    """Keep track of how well websocket messages are being compressed, and
+    publish it to Attributes"""
+
+    def __init__(self, threshold):
+        # type: (int) -> None
+        self.threshold = threshold
+        self.ratio = NumberMeta(
+            "float64",
+            "Ratio of uncompressed to compressed size of websocket messages",
+            tags=[Widget.TEXTUPDATE.tag()]
+        ).create_attribute_model(1.0)
+        self.time = NumberMeta(
+            "float64", "Total time in seconds spent compressing websocket "
+                       "messages",
+            tags=[Widget.TEXTUPDATE.tag()]
+        ).create_attribute_model()
+        self._raw_bytes = 0
+        self._compressed_bytes = 0
+        self._seconds = 0.0
+        self._last_published = 0.0
+
+    def write_message(self, protocol, message):
+        """Write message to a websocket protocol object, only compressing it
+        if permessage-deflate was negotiated and it is over the threshold
+
+        Args:
+            protocol (WebSocketProtocol): The ws_connection of the handler or
+                protocol of the client connection
+            message (str): The message to send
+
+        Returns:
+            Future: When the message has been written to the socket
+        """
+        # Tornado compresses every message if a compressor was negotiated, but
+        # permessage-deflate allows each message to be sent uncompressed.
+        # These are private attributes of tornado 4.5's WebSocketProtocol13,
+        # so if they aren't there just send it without keeping stats
+        compressor = getattr(protocol, "_compressor", None)
+        if compressor is None or not hasattr(protocol, "_wire_bytes_out"):
+            return protocol.write_message(message)
+        # Tornado would encode it anyway, do it here so we count bytes to
+        # compare with _wire_bytes_out rather than characters
+        message = utf8(message)
+        if len(message) < self.threshold:
+            protocol._compressor = None
+            try:
+                return protocol.write_message(message)
+            finally:
+                protocol._compressor = compressor
+        else:
+            wire_bytes = protocol._wire_bytes_out
+            start = time.time()
+            future = protocol.write_message(message)
+            end = time.time()
+            self._raw_bytes += len(message)
+            self._compressed_bytes += protocol._wire_bytes_out - wire_bytes
+            self._seconds += end - start
+            if end - self._last_published > METRICS_PERIOD:
+                self._last_published = end
+                self.publish()
+            return future
+
+    def publish(self):
+        """Update the Attributes with the current statistics"""
+        if self._compressed_bytes:
+            self.ratio.set_value(
+                float(self._raw_bytes) / self._compressed_bytes)
+        self.time.set_value(self._seconds)
+
+
+class OrderedWorkers(object):
+    """Run functions in a pool of worker threads and pass the results back to
+    the tornado thread, keeping the order of everything submitted with the same
+    key. With no workers, functions are run in the tornado thread"""
+
+    def __init__(self, num_workers):
+        # type: (int) -> None
+        self.num_workers = num_workers
+        self._loop = None  # type: IOLoop
+        self._pool = None  # type: ThreadPool
+        # {key: [(func, args, callback)]} waiting to be run
+        self._pending = {}
+        # keys that have a batch of jobs in a worker
+        self._running = set()
+
+    def start(self, loop):
+        # type: (IOLoop) -> None
+        self._loop = loop
+        if self.num_workers > 0 and self._pool is None:
+            self._pool = ThreadPool(self.num_workers)
+
+    def stop(self):
+        # type: () -> None
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.close()
+            pool.join()
+
+    def run(self, key, callback, func, *args):
+        """Call func(*args) in a worker, then callback(result) in the tornado
+        thread. If func raises, the exception is logged and passed to
+        callback instead. Called in the tornado thread"""
+        if self._pool is None and key not in self._running and \
+                key not in self._pending:
+            # Nothing in front of us, so can do it now
+            self._jobs_done(key, self._run_jobs([(func, args, callback)]))
+            return
+        self._pending.setdefault(key, []).append((func, args, callback))
+        if key not in self._running:
+            self._running.add(key)
+            self._start(key)
+
+    def _start(self, key):
+        jobs = self._pending.pop(key)
+        if self._pool is None:
+            # Stopped while there were jobs waiting, so do them here
+            self._jobs_done(key, self._run_jobs(jobs))
+        else:
+            self._pool.apply_async(self._run_in_worker, (key, jobs))
+
+    def _run_in_worker(self, key, jobs):
+        # called in a worker thread
+        self._loop.add_callback(self._jobs_done, key, self._run_jobs(jobs))
+
+    def _run_jobs(self, jobs):
+        results = []
+        for func, args, callback in jobs:
+            try:
+                result = func(*args)
+            except Exception as e:
+                log.exception("Error running %s%s", func, args)
+                result = e
+            results.append((callback, result))
+        return results
+
+    def _jobs_done(self, key, results):
+        # called in tornado thread
+        for callback, result in results:
+            try:
+                callback(result)
+            except Exception:
+                log.exception("Error calling %s(%r)", callback, result)
+        if key in self._pending:
+            self._start(key)
+        else:
+            self._running.discard(key)
+
+
+class IOLoopLag(object):
+    """Measure how late the IOLoop is in running a timeout, which is how long
+    any request or response can be held up in it, and publish it to an
+    Attribute"""
+
+    def __init__(self, period=METRICS_PERIOD):
+        # type: (float) -> None
+        self.period = period
+        self.lag = NumberMeta(
+            "float64", "Time in seconds the web server IOLoop was late "
+                       "running a callback in the last %s seconds" % period,
+            tags=[Widget.TEXTUPDATE.tag()]
+        ).create_attribute_model()
+        self._loop = None  # type: IOLoop
+        self._due = None
+        self._timeout = None
+
+    def start(self, loop):
+        # type: (IOLoop) -> None
+        """Start measuring. Called from any thread"""
+        self._loop = loop
+        loop.add_callback(self._restart)
+
+    def stop(self):
+        # type: () -> None
+        """Stop measuring. Called from any thread"""
+        if self._loop:
+            self._loop.add_callback(self._cancel)
+
+    def _restart(self):
+        self._cancel()
+        self._schedule()
+
+    def _schedule(self):
+        self._due = self._loop.time() + self.period
+        self._timeout = self._loop.call_at(self._due, self._measure)
+
+    def _cancel(self):
+        if self._timeout:
+            self._loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _measure(self):
+        self.lag.set_value(self._loop.time() - self._due)
+        self._schedule()
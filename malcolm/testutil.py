@@ -30,7 +30,7 @@ class ChildTestCase(unittest.TestCase):
             # We've already setup the CAParts and added to the block, so we
             # can safely delete them so they don't try to connect
             controller.parts = {}
-            process.add_controller(controller)
+        process.add_controllers(controllers)
         child = controllers[-1]
         child.handled_requests = Mock(return_value=None)
 
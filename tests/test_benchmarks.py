@@ -0,0 +1,63 @@
+import contextlib
+import unittest
+
+from mock import Mock
+
+from benchmarks.loadgen import ClientStats, summarise
+from benchmarks.runner import compare_results
+from benchmarks.util import registry, time_benchmark, benchmark
+
+
+def make_results(**medians):
+    return dict(results=dict(thread={
+        k: dict(median=v) for k, v in medians.items()}))
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_register_parametrized(self):
+        @benchmark("test_thing", size=[1, 2])
+        def thing(size):
+            yield lambda: None
+        try:
+            assert registry["test_thing[size=1]"][1] == dict(size=1)
+            assert registry["test_thing[size=2]"][1] == dict(size=2)
+        finally:
+            registry.pop("test_thing[size=1]")
+            registry.pop("test_thing[size=2]")
+
+    def test_time_benchmark(self):
+        torn_down = []
+
+        @contextlib.contextmanager
+        def thing():
+            yield lambda: None
+            torn_down.append(True)
+
+        result = time_benchmark(thing, {}, 10, 3, 0.001)
+        assert result["repeats"] == 3
+        assert result["ops"] == 10
+        assert result["min"] <= result["median"] <= result["max"]
+        assert torn_down == [True]
+
+    def test_compare(self):
+        baseline = make_results(a=2.0, b=2.0, c=2.0)
+        current = make_results(a=2.0, b=4.0, d=2.0)
+        rows, regressions = compare_results(baseline, current, 0.25)
+        assert sorted(rows) == [
+            ("thread", "a", 2.0, 2.0, 1.0), ("thread", "b", 2.0, 4.0, 2.0)]
+        assert regressions == [("thread", "b", 2.0, 4.0, 2.0)]
+
+    def test_loadgen_stats(self):
+        client = ClientStats("ws")
+        # Initial value doesn't count
+        client.update(("LOAD:0", "attr0"), 0.0, 0)
+        client.update(("LOAD:0", "attr0"), 1.0, 0)
+        # Update 2 was coalesced
+        client.update(("LOAD:0", "attr0"), 3.0, 0)
+        assert client.received == 2
+        assert client.coalesced == 1
+        summary = summarise([Mock(stats=client)], ticks=5)
+        assert summary["ws"]["received"] == 2
+        assert summary["ws"]["coalesced"] == 1
+        # Updates 4 and 5 never arrived
+        assert summary["ws"]["dropped"] == 2
@@ -59,6 +59,19 @@ class TestController(unittest.TestCase):
         assert dict_view['return'].description == "The return value"
         assert list_view[0] == "return"
 
+    def test_get_generation(self):
+        block = self.o.get_generation(["mri"])
+        attr = self.o.get_generation(["mri", "myAttribute"])
+        method = self.o.get_generation(["mri", "method"])
+        # Leaves report the generation of the Model that contains them
+        assert self.o.get_generation(["mri", "myAttribute", "value"]) == attr
+        self.part.my_attribute.set_value("changed")
+        assert self.o.get_generation(["mri"]) > block
+        assert self.o.get_generation(["mri", "myAttribute"]) > attr
+        assert self.o.get_generation(["mri", "method"]) == method
+        with self.assertRaises(KeyError):
+            self.o.get_generation(["mri", "missing"])
+
     def test_handle_request(self):
         q = Queue()
 
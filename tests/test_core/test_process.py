@@ -65,3 +65,59 @@ class TestProcess(unittest.TestCase):
         assert c.published == ["mri", "mri2"]
         self.o.add_controller(UnpublishableController("mri3"))
         assert c.published == ["mri", "mri2"]
+
+    def test_start_dependency_order(self):
+        started = []
+
+        class DependentController(Controller):
+            dependencies = []
+
+            def get_start_dependencies(self):
+                return self.dependencies
+
+            def on_hook(self, hook):
+                if isinstance(hook, ProcessStartHook):
+                    hook(self.on_start)
+
+            def on_start(self):
+                started.append(self.mri)
+
+        def make_controller(mri, *dependencies):
+            c = DependentController(mri)
+            c.dependencies = list(dependencies)
+            return c
+
+        p = Process("proc2")
+        # Add them in reverse order so we know the dependencies are honoured
+        p.add_controller(make_controller("top", "mid1", "mid2"))
+        p.add_controller(make_controller("mid1", "bottom"))
+        p.add_controller(make_controller("mid2", "bottom", "missing"))
+        p.add_controller(make_controller("bottom"))
+        p.start()
+        try:
+            assert started[0] == "bottom"
+            assert sorted(started[1:3]) == ["mid1", "mid2"]
+            assert started[3] == "top"
+            assert list(sorted(p.start_durations)) == [
+                "bottom", "mid1", "mid2", "top"]
+        finally:
+            p.stop(timeout=1)
+
+    def test_add_controllers_publishes_once(self):
+        class PublishController(Controller):
+            published = []
+
+            def on_hook(self, hook):
+                if isinstance(hook, ProcessPublishHook):
+                    hook(self.do_publish)
+
+            @add_call_types
+            def do_publish(self, published):
+                # type: (APublished) -> None
+                self.published.append(published)
+
+        c = PublishController("mri")
+        self.o.add_controller(c)
+        c.published = []
+        self.o.add_controllers([Controller("mri2"), Controller("mri3")])
+        assert c.published == [["mri", "mri2", "mri3"]]
@@ -5,7 +5,8 @@ from mock import MagicMock, ANY
 from malcolm.compat import OrderedDict
 from malcolm.core import json_decode
 from malcolm.core.request import Request, Get, Post, Subscribe, Unsubscribe, Put
-from malcolm.core.response import Return, Error, Update, Delta, Response
+from malcolm.core.response import Return, Error, Update, Delta, Response, \
+    apply_changes
 
 
 def get_doc_json(fname):
@@ -211,4 +212,16 @@ class TestResponse(unittest.TestCase):
         assert r.changes == changes
 
 
+class TestApplyChanges(unittest.TestCase):
+    def test_copy_on_write(self):
+        a = OrderedDict([("value", 1)])
+        b = OrderedDict([("value", 2)])
+        old = OrderedDict([("a", a), ("b", b)])
+        new = apply_changes(old, [[["a", "value"], 3], [["b"]], [["c"], 4]])
+        assert new == dict(a=dict(value=3), c=4)
+        # Original is untouched, and unchanged parts are shared
+        assert old == dict(a=dict(value=1), b=dict(value=2))
+        assert apply_changes(old, [[["b", "value"], 5]])["a"] is a
 
+    def test_root_change(self):
+        assert apply_changes(dict(a=1), [[[], 2]]) == 2
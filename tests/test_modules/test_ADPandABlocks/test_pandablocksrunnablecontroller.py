@@ -29,18 +29,16 @@ class PandABlocksRunnableControllerTest(unittest.TestCase):
         self.o._make_blocks_parts()
 
     def _blocks(self):
-        pcap = self.process.add_controller.call_args_list[0][0][0]
+        pcap, inenc = self.process.add_controllers.call_args[0][0]
         assert pcap.mri == "P:PCAP"
         pcap.setup(self.process)
-        inenc = self.process.add_controller.call_args_list[1][0][0]
         assert inenc.mri == "P:INENC"
         inenc.setup(self.process)
         return pcap.make_view(), inenc.make_view()
 
     def test_initial_changes(self):
         assert self.process.mock_calls == [
-            call.add_controller(ANY, timeout=5),
-            call.add_controller(ANY, timeout=5)]
+            call.add_controllers([ANY, ANY], timeout=5)]
         pcap, inenc = self._blocks()
         with self.assertRaises(Exception):
             pcap.ts
@@ -1,8 +1,8 @@
 import unittest
-from mock import MagicMock
+from mock import MagicMock, patch, ANY, call
 
 from malcolm.modules.builtin.controllers import ProxyController
-from malcolm.core import Process
+from malcolm.core import Process, Put, Return, NumberMeta
 
 
 class TestProxyController(unittest.TestCase):
@@ -19,3 +19,39 @@ class TestProxyController(unittest.TestCase):
         assert self.o.mri == "mri"
         assert self.o.comms == "comms"
         assert self.o.client_comms is None
+
+    def put(self, get):
+        meta = NumberMeta("int32", writeable=True)
+        self.o._block.set_endpoint_data("attr", meta.create_attribute_model(1))
+        request = Put(path=["mri", "attr", "value"], value="2", get=get)
+        request.set_callback(MagicMock())
+        with self.o._lock:
+            responses = self.o._handle_put(request)
+        return request, responses
+
+    def test_put_async_returns_local_value(self):
+        self.o.client_comms = MagicMock()
+        request, responses = self.put(get=True)
+        assert responses == []
+        self.o.client_comms.send_put_async.assert_called_once_with(
+            "mri", "attr", 2)
+        future = self.o.client_comms.send_put_async.return_value
+        # The client comms updates our Block before the server responds
+        self.o._block.attr.set_value(2)
+        future.result.return_value = {"serialized": "value"}
+        self.o._respond(request, future)
+        response = request.callback.call_args[0][0]
+        assert isinstance(response, Return)
+        assert response.value == 2
+
+    @patch.object(NumberMeta, "validate", autospec=True,
+                  side_effect=NumberMeta.validate)
+    def test_put_blocking_validates_once(self, validate):
+        self.o.client_comms = MagicMock()
+        self.o.client_comms.send_put_async.return_value = None
+        request, responses = self.put(get=True)
+        self.o.client_comms.send_put.assert_called_once_with("mri", "attr", 2)
+        # Once for the initial value, once for the Put
+        assert validate.call_args_list == [call(ANY, 1), call(ANY, "2")]
+        assert len(responses) == 1
+        assert responses[0][1].value == 1
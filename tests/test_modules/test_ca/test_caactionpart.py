@@ -36,10 +36,10 @@ class TestCAActionPart(unittest.TestCase):
 
     def test_reset(self, catools):
         p = self.create_part()
-        p.catools.caget.reset_mock()
-        p.catools.caget.return_value = [caint(4)]
+        p.catools.checking_caget.reset_mock()
         p.connect_pvs()
-        p.catools.caget.assert_called_with(["pv"])
+        p.catools.checking_caget.assert_called_with(
+            ["pv"], batch_key=p.registrar._field_registry)
 
     def test_caput(self, catools):
         p = self.create_part()
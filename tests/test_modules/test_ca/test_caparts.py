@@ -18,7 +18,7 @@ class TestCAParts(unittest.TestCase):
         self.process.start()
 
     def create_block(self, p):
-        c = StatefulController("mri")
+        self.c = c = StatefulController("mri")
         c.add_part(p)
         self.process.add_controller(c)
         b = self.process.block_view("mri")
@@ -41,7 +41,8 @@ class TestCAParts(unittest.TestCase):
         assert b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ["pv2", 'pv'], datatype=catools.DBR_LONG,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
         class Update(int):
             ok = True
@@ -69,7 +70,8 @@ class TestCAParts(unittest.TestCase):
         assert b.cattr.value == "long_and_bad_string"
         assert b.cattr.alarm.severity == AlarmSeverity.MINOR_ALARM
         catools.checking_caget.assert_called_once_with(
-            ["pvr"], datatype=catools.DBR_CHAR_STR, format=catools.FORMAT_CTRL)
+            ["pvr"], datatype=catools.DBR_CHAR_STR, format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
     def test_cachoice(self, catools):
 
@@ -86,7 +88,8 @@ class TestCAParts(unittest.TestCase):
         assert b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ["rbv", 'pv'], datatype=catools.DBR_ENUM,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
         class Update(int):
             ok = True
@@ -127,7 +130,8 @@ class TestCAParts(unittest.TestCase):
         assert b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ["pv"], datatype=catools.DBR_DOUBLE,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
         class Update(np.ndarray):
             ok = False
@@ -156,7 +160,8 @@ class TestCAParts(unittest.TestCase):
         assert not b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ['pv'], datatype=catools.DBR_DOUBLE,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
         l = []
         b.attrname.subscribe_value(l.append)
@@ -167,6 +172,11 @@ class TestCAParts(unittest.TestCase):
         callback = catools.camonitor.call_args[0][1]
         callback(Initial(8.7))
         callback(Initial(8.8))
+        # Second one is within min_delta, so is posted later
+        assert b.attrname.value == 8.7
+        b._context.sleep(0.1)
+        post_pending = catools.cothread.Spawn.call_args[0][0]
+        post_pending()
         assert b.attrname.value == 8.8
 
         b._context.sleep(0.1)
@@ -188,7 +198,8 @@ class TestCAParts(unittest.TestCase):
         assert b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ["pv"], datatype=catools.DBR_LONG,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
         class Update(np.ndarray):
             ok = True
@@ -220,7 +231,8 @@ class TestCAParts(unittest.TestCase):
         assert b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ['pv'], datatype=catools.DBR_LONG,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
     def test_castring(self, catools):
 
@@ -236,7 +248,8 @@ class TestCAParts(unittest.TestCase):
         assert not b.attrname.meta.writeable
         catools.checking_caget.assert_called_once_with(
             ['pv'], datatype=catools.DBR_STRING,
-            format=catools.FORMAT_CTRL)
+            format=catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
 
     def test_init_no_pv_no_rbv(self, catools):
         # create test for no pv or rbv
@@ -0,0 +1,182 @@
+import threading
+import unittest
+
+from mock import MagicMock, patch, call
+
+from malcolm.core import Queue, NumberMeta, AlarmSeverity
+from malcolm.modules.ca.util import CaToolsHelper, CAAttribute, \
+    CONNECT_TIMEOUT
+
+
+class caint(int):
+    ok = True
+
+
+class canothing(int):
+    ok = False
+
+    def __str__(self):
+        return "disconnected"
+
+
+class camonitor(int):
+    ok = True
+    raw_stamp = (1, 0)
+
+    def __new__(cls, value, severity=0):
+        inst = super(camonitor, cls).__new__(cls, value)
+        inst.severity = severity
+        return inst
+
+
+class TestCaToolsHelper(unittest.TestCase):
+    def setUp(self):
+        # Make one without importing catools, as that needs libca
+        self.o = CaToolsHelper.__new__(CaToolsHelper)
+        self.o._batch = None
+        self.o._batch_lock = threading.Lock()
+        self.o.in_cothread_thread = False
+        self.o.cothread = MagicMock()
+        self.spawned = []
+        self.o.cothread.Spawn.side_effect = \
+            lambda f, *args: self.spawned.append((f, args))
+        self.o.cothread.Callback.side_effect = \
+            lambda f, *args: self.spawned.append((f, args))
+        self.o.catools = MagicMock()
+        values = dict(a=caint(1), b=caint(2), c=caint(3), d=canothing())
+        self.o.catools.caget.side_effect = \
+            lambda pvs, **kwargs: [values[pv] for pv in pvs]
+
+    def request(self, pvs, batch_key=None, **kwargs):
+        done = Queue()
+        self.o._add_to_batch(
+            pvs, (batch_key, tuple(sorted(kwargs.items()))), done)
+        return done
+
+    def run_spawned(self):
+        while self.spawned:
+            f, args = self.spawned.pop(0)
+            f(*args)
+
+    def test_cagets_batched(self):
+        dones = [
+            self.request(["a", "b"], "block1", format=1),
+            self.request(["b", "c"], "block1", format=1),
+            self.request(["a"], "block1", format=2),
+            self.request(["d", "c"], "block2", format=1)]
+        # Only the first request goes to cothread's thread
+        assert len(self.spawned) == 1
+        assert self.o.cothread.Callback.call_count == 1
+        self.run_spawned()
+        results = [done.get(timeout=0) for done in dones]
+        assert results[0] == [1, 2]
+        assert results[1] == [2, 3]
+        assert results[2] == [1]
+        assert isinstance(results[3], AssertionError)
+        assert str(results[3]) == "CA connect failed with disconnected"
+        # One caget per Block and set of kwargs, each PV with its own timeout
+        assert self.o.catools.caget.call_args_list == [
+            call(["a", "b", "c"], throw=False, timeout=CONNECT_TIMEOUT,
+                 format=1),
+            call(["a"], throw=False, timeout=CONNECT_TIMEOUT, format=2),
+            call(["d", "c"], throw=False, timeout=CONNECT_TIMEOUT, format=1)]
+        # The next request starts a new batch
+        self.request(["a"])
+        assert len(self.spawned) == 1
+
+    def test_caget_error_fails_its_batch(self):
+        self.o.catools.caget.side_effect = ValueError("bad datatype")
+        dones = [self.request(["a"], "block1"), self.request(["b"], "block1")]
+        self.run_spawned()
+        for done in dones:
+            assert str(done.get(timeout=0)) == "bad datatype"
+
+
+@patch("malcolm.modules.ca.util.time")
+@patch("malcolm.modules.ca.util.CaToolsHelper._instance")
+class TestCAAttributeThrottle(unittest.TestCase):
+    def make_attribute(self, catools):
+        self.spawned = []
+        catools.cothread.Spawn.side_effect = \
+            lambda f, *args: self.spawned.append((f, args))
+        o = CAAttribute(NumberMeta("int32", "desc"), catools.DBR_LONG,
+                        rbv="pv", min_delta=0.1)
+        return o
+
+    def test_latest_value_posted_after_window(self, catools, time):
+        o = self.make_attribute(catools)
+        time.time.return_value = 10.0
+        o._monitor_callback(camonitor(1))
+        assert o.attr.value == 1
+        # Inside the window, so kept back without blocking the callback
+        time.time.return_value = 10.02
+        o._monitor_callback(camonitor(2))
+        o._monitor_callback(camonitor(3))
+        assert o.attr.value == 1
+        catools.cothread.Sleep.assert_not_called()
+        assert len(self.spawned) == 1
+        assert o.dropped == 1
+        # The waiting cothread sleeps until the window expires
+        f, args = self.spawned.pop()
+        catools.cothread.Sleep.side_effect = \
+            lambda t: setattr(time.time, "return_value", 10.0 + 0.1)
+        f(*args)
+        catools.cothread.Sleep.assert_called_once()
+        assert o.attr.value == 3
+        assert not o._waiting
+
+    def test_dropped_logged(self, catools, time):
+        o = self.make_attribute(catools)
+        o.log = MagicMock()
+        time.time.return_value = 10.0
+        for i in range(4):
+            o._monitor_callback(camonitor(i))
+        f, args = self.spawned.pop()
+        time.time.return_value = 10.2
+        f(*args)
+        o.log.debug.assert_called_once_with(
+            "Dropped %d monitor updates within min_delta, %d in total", 2, 2)
+        assert o.dropped_attr.value == 2
+        # Not logged again until the period has passed
+        for i in range(3):
+            o._monitor_callback(camonitor(i))
+        f, args = self.spawned.pop()
+        time.time.return_value = 10.4
+        f(*args)
+        assert o.log.debug.call_count == 1
+        assert o.dropped == 4
+        assert o.dropped_attr.value == 2
+
+    def test_alarms_and_disconnects_posted_at_once(self, catools, time):
+        o = self.make_attribute(catools)
+        time.time.return_value = 10.0
+        o._monitor_callback(camonitor(1))
+        time.time.return_value = 10.01
+        o._monitor_callback(camonitor(2))
+        assert o.attr.value == 1
+        o._monitor_callback(camonitor(3, severity=1))
+        assert o.attr.value == 3
+        assert o.attr.alarm.severity == AlarmSeverity.MINOR_ALARM
+        # The value it replaced was dropped
+        assert o.dropped == 1
+        disconnected = MagicMock(ok=False)
+        o._monitor_callback(disconnected)
+        assert o.attr.value == 0
+        assert o.attr.alarm.message == "PV disconnected"
+        # Nothing left for the waiting cothread to post
+        f, args = self.spawned.pop()
+        f(*args)
+        assert o.attr.alarm.message == "PV disconnected"
+
+    def test_first_update_after_reconnect_posted(self, catools, time):
+        o = self.make_attribute(catools)
+        time.time.return_value = 10.0
+        o._monitor_callback(camonitor(1, severity=1))
+        o._monitor_callback(camonitor(2, severity=1))
+        assert o._pending is not None
+        catools.checking_caget.return_value = [camonitor(3)]
+        o.reconnect()
+        assert o.attr.value == 3
+        # Same severity as before, and still inside the old window
+        o._monitor_callback(camonitor(4, severity=1))
+        assert o.attr.value == 4
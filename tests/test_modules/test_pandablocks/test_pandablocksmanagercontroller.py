@@ -49,11 +49,9 @@ class PandABlocksManagerControllerTest(unittest.TestCase):
         self.o.handle_changes({})
 
     def _blocks(self):
-        pcomp = self.process.add_controller.call_args_list[0][0][0]
+        pcomp, counter, ttlin = self.process.add_controllers.call_args[0][0]
         assert pcomp.mri == "P:PCOMP"
-        counter = self.process.add_controller.call_args_list[1][0][0]
         assert counter.mri == "P:COUNTER"
-        ttlin = self.process.add_controller.call_args_list[2][0][0]
         assert ttlin.mri == "P:TTLIN"
         # Using a mock, so setup these controllers
         for c in (pcomp, counter, ttlin):
@@ -62,9 +60,7 @@ class PandABlocksManagerControllerTest(unittest.TestCase):
 
     def test_initial_changes(self):
         assert self.process.mock_calls == [
-            call.add_controller(ANY, timeout=5),
-            call.add_controller(ANY, timeout=5),
-            call.add_controller(ANY, timeout=5),
+            call.add_controllers([ANY, ANY, ANY], timeout=5),
             call.get_controller('P:PCOMP'),
             call.get_controller().changes_squashed.__enter__(),
             call.get_controller().changes_squashed.__exit__(None, None, None),
@@ -18,7 +18,7 @@ class TestCompoundMotorCSPart(unittest.TestCase):
         catools.checking_caget.side_effect = [[castr("@asyn(BRICK1CS1,2)")]]
         self.process = Process("proc")
         self.o = CompoundMotorCSPart("cs", "PV:PRE.OUT")
-        c = StatefulController("mri")
+        self.c = c = StatefulController("mri")
         c.add_part(self.o)
         self.process.add_controller(c)
         self.b = self.process.block_view("mri")
@@ -27,7 +27,8 @@ class TestCompoundMotorCSPart(unittest.TestCase):
 
     def test_init(self):
         self.catools.checking_caget.assert_called_once_with(
-            ["PV:PRE.OUT"], format=self.catools.FORMAT_CTRL)
+            ["PV:PRE.OUT"], format=self.catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
         assert list(self.b) == [
             'meta', 'health', 'state', 'disable', 'reset', 'cs']
         assert self.b.cs.value == "BRICK1CS1,B"
@@ -18,7 +18,7 @@ class TestCSOutlinksPart(unittest.TestCase):
         catools.checking_caget.side_effect = [[castr("BRICK1CS1")]]
         self.process = Process("proc")
         self.o = CSSourcePortsPart("cs", "PV:PRE:Port")
-        c = StatefulController("mri")
+        self.c = c = StatefulController("mri")
         c.add_part(self.o)
         self.process.add_controller(c)
         self.b = self.process.block_view("mri")
@@ -28,9 +28,10 @@ class TestCSOutlinksPart(unittest.TestCase):
     def test_init(self):
         self.catools.checking_caget.assert_called_once_with(
             ["PV:PRE:Port"], datatype=self.catools.DBR_STRING,
-            format=self.catools.FORMAT_CTRL)
+            format=self.catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
         assert list(self.b) == [
-            'meta', 'health', 'state', 'disable', 'reset', 'cs',
+            'meta', 'health', 'state', 'disable', 'reset', 'cs', 'csDropped',
             'a', 'b', 'c', 'u', 'v', 'w', 'x', 'y', 'z', 'i']
         assert self.b.cs.value == "BRICK1CS1"
         assert self.b.a.value == ""
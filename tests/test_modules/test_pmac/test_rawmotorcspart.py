@@ -27,7 +27,7 @@ class TestRawMotorCSPart(unittest.TestCase):
         ]]
         self.process = Process("proc")
         self.o = RawMotorCSPart("cs", "PV:PRE")
-        c = StatefulController("mri")
+        self.c = c = StatefulController("mri")
         c.add_part(self.o)
         self.process.add_controller(c)
         self.b = self.process.block_view("mri")
@@ -37,7 +37,8 @@ class TestRawMotorCSPart(unittest.TestCase):
     def test_init(self):
         self.catools.checking_caget.assert_called_once_with(
             ["PV:PRE:CsPort", "PV:PRE:CsAxis", "PV:PRE:CsPort_RBV",
-             "PV:PRE:CsAxis_RBV"], format=self.catools.FORMAT_CTRL)
+             "PV:PRE:CsAxis_RBV"], format=self.catools.FORMAT_CTRL,
+            batch_key=self.c.field_registry)
         assert list(self.b) == [
             'meta', 'health', 'state', 'disable', 'reset', 'cs']
         assert self.b.cs.value == "BRICK1CS1,A"
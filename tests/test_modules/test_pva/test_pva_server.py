@@ -6,17 +6,21 @@ from __future__ import print_function
 import difflib
 import unittest
 
+from mock import MagicMock
 from p4p.nt.scalar import ntfloat
 from p4p.client.thread import TimeoutError
 from p4p import Value, Type
 from p4p.client.raw import RemoteError
 
 
-from malcolm.compat import maybe_import_cothread
-from malcolm.core import Process, Queue
+from malcolm.compat import maybe_import_cothread, sleep
+from malcolm.core import Process, Queue, Delta, Method, \
+    method_return_unpacked
 from malcolm.modules.demo.blocks import hello_block, counter_block
 from malcolm.modules.pva.blocks import pva_server_block
-from malcolm.modules.pva.controllers.pvaconvert import EMPTY
+from malcolm.modules.pva.controllers.pvaconvert import EMPTY, \
+    convert_dict_to_value
+from malcolm.modules.pva.controllers.pvaservercomms import BlockHandler
 
 
 # Set to true if running against old server
@@ -573,3 +577,58 @@ class TestPVAServer(unittest.TestCase):
                 self.ctxt.rpc("TESTHELLO.error", EMPTY)
             self.assertEqual(str(cm.exception),
                              "RuntimeError: You called method error()")
+
+
+class TestBlockHandler(unittest.TestCase):
+    def setUp(self):
+        self.controller = MagicMock(mri="MRI", use_cothread=False)
+        greet = MagicMock(spec=Method, tags=[method_return_unpacked()])
+        self.controller.make_view.return_value = dict(
+            greet=greet, attr=MagicMock())
+        self.o = BlockHandler(self.controller)
+
+    def test_method_metadata_cached(self):
+        assert self.o._return_unpacked("greet") is True
+        assert self.o._return_unpacked("greet") is True
+        assert self.controller.make_view.call_count == 1
+        # Changes to other fields don't affect it
+        self.o.handle(Delta(1, [[["attr", "value"], 1]]))
+        assert self.o._return_unpacked("greet") is True
+        assert self.controller.make_view.call_count == 1
+        # But changes to the method or BlockMeta do
+        self.o.handle(Delta(1, [[["greet", "tags"], []]]))
+        self.o._return_unpacked("greet")
+        assert self.controller.make_view.call_count == 2
+        self.o.handle(Delta(1, [[["meta", "fields"], ["greet"]]]))
+        self.o._return_unpacked("greet")
+        assert self.controller.make_view.call_count == 3
+
+    def test_methods_forgotten_on_last_disconnect(self):
+        assert self.o._return_unpacked("greet") is True
+        self.o.pv = MagicMock()
+        self.o._on_last_disconnect(self.o.pv)
+        assert self.o._methods == {}
+        self.o._return_unpacked("greet")
+        assert self.controller.make_view.call_count == 2
+
+    def test_not_a_method(self):
+        with self.assertRaises(AssertionError):
+            self.o._return_unpacked("attr")
+        assert self.o._methods == {}
+
+    def test_max_rate_merges_posts(self):
+        o = BlockHandler(self.controller, max_rate=10)
+        o.pv = MagicMock()
+        o._open(convert_dict_to_value(dict(
+            a=dict(value=1.0), b=dict(value=2.0))))
+        # Straight after open, so these are held back
+        o.handle(Delta(1, [[["a", "value"], 3.0]]))
+        o.handle(Delta(1, [[["b", "value"], 4.0]]))
+        o.pv.post.assert_not_called()
+        # A timer posts them together, without using the controller's pool
+        sleep(0.2)
+        self.controller.spawn.assert_not_called()
+        o.pv.post.assert_called_once_with(o.value)
+        assert o.value.changedSet() == {"a.value", "b.value"}
+        assert o.value.a.value == 3.0
+        assert o.value.b.value == 4.0
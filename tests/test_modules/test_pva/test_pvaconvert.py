@@ -0,0 +1,104 @@
+import unittest
+
+from annotypes import Array
+import numpy as np
+from mock import patch
+from p4p import Type
+
+from malcolm.compat import OrderedDict
+from malcolm.core import NumberArrayMeta
+from malcolm.modules.pva.controllers.pvaconvert import \
+    convert_dict_to_value, convert_value_to_dict, replace_fields, \
+    compile_update, convert_to_type_tuple_value
+
+
+def make_dict(value, tags):
+    d = OrderedDict()
+    d["typeid"] = "epics:nt/NTScalar:1.0"
+    d["value"] = value
+    d["tags"] = tags
+    return d
+
+
+class TestPvaConvert(unittest.TestCase):
+    @patch("malcolm.modules.pva.controllers.pvaconvert.Type", wraps=Type)
+    def test_same_layout_shares_type(self, mock_type):
+        convert_dict_to_value(make_dict(1.0, Array[str](["a"])))
+        v2 = convert_dict_to_value(make_dict(2.0, Array[str](["b", "c"])))
+        assert mock_type.call_count <= 1
+        assert v2.value == 2.0
+        assert list(v2.tags) == ["b", "c"]
+
+    def test_different_layout_different_type(self):
+        v1 = convert_dict_to_value(make_dict(1.0, ["a"]))
+        v2 = convert_dict_to_value(make_dict("x", ["a"]))
+        assert v1.type()["value"] == "d"
+        assert v2.type()["value"] == "s"
+        assert v2.value == "x"
+        assert convert_value_to_dict(v1) == make_dict(1.0, ["a"])
+
+    def test_replace_fields(self):
+        d = OrderedDict()
+        d["typeid"] = "malcolm:core/Block:1.0"
+        d["attr"] = make_dict(1.0, ["a"])
+        d["other"] = make_dict(2.0, ["b"])
+        d["gone"] = make_dict(3.0, ["c"])
+        value = convert_dict_to_value(d)
+        new = replace_fields(value, OrderedDict([
+            ("attr", make_dict("x", ["a"])),
+            ("gone", None),
+            ("added", make_dict(True, []))]))
+        assert new.getID() == "malcolm:core/Block:1.0"
+        assert list(new.type().keys()) == ["attr", "other", "added"]
+        assert new.attr.value == "x"
+        assert new.other.value == 2.0
+        assert new.added.value is True
+        # Original is untouched
+        assert value.attr.value == 1.0
+
+    def test_compile_update(self):
+        d = OrderedDict()
+        d["typeid"] = "malcolm:core/Block:1.0"
+        d["attr"] = make_dict(1.0, ["a"])
+        d["attr"]["timeStamp"] = OrderedDict([
+            ("typeid", "time_t"), ("secondsPastEpoch", 0),
+            ("nanoseconds", 0)])
+        d["arr"] = make_dict(np.zeros(3), [])
+        value = convert_dict_to_value(d)
+        set_value = compile_update(value, ["attr", "value"], 2.0)
+        set_ts = compile_update(value, ["attr", "timeStamp"], {})
+        set_tags = compile_update(value, ["attr", "tags"], Array[str]())
+        set_arr = compile_update(value, ["arr", "value"], np.zeros(3))
+        for i in range(2):
+            set_value(3.0 + i)
+            set_ts(dict(typeid="time_t", secondsPastEpoch=10 + i))
+            set_tags(Array[str](["b", "c"]))
+            set_arr(np.arange(4.0) + i)
+            assert value.attr.value == 3.0 + i
+            assert value.attr.timeStamp.secondsPastEpoch == 10 + i
+            assert list(value.attr.tags) == ["b", "c"]
+            assert list(value.arr.value) == [i, i + 1, i + 2, i + 3]
+        # Can't set a field that doesn't exist
+        with self.assertRaises(KeyError):
+            compile_update(value, ["attr", "timeStamp"], dict(bad=1))(
+                dict(bad=1))
+
+    def test_lists_of_one_type(self):
+        spec, value = convert_to_type_tuple_value([1.0, 2.5])
+        assert spec == "ad"
+        assert isinstance(value, np.ndarray)
+        assert convert_to_type_tuple_value([True, False])[0] == "a?"
+        assert convert_to_type_tuple_value(["a", "b"]) == ("as", ["a", "b"])
+        # Mixed types still work
+        assert convert_to_type_tuple_value([1, 2.5])[0] == "av"
+
+    def test_numpy_arrays_not_copied_on_client(self):
+        meta = NumberArrayMeta("float64")
+        served = meta.create_attribute_model(np.arange(1e5)).to_dict()
+        value = convert_dict_to_value(served)
+        received = convert_value_to_dict(value)["value"]
+        assert isinstance(received, np.ndarray)
+        # The validated Array wraps the buffer p4p gave us
+        validated = meta.validate(received)
+        assert np.may_share_memory(validated.seq, value.value)
+        assert validated == served["value"]
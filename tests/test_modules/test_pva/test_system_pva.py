@@ -1,10 +1,12 @@
 import unittest
 
+from mock import patch
 from p4p.client.raw import RemoteError
 from scanpointgenerator import LineGenerator, CompoundGenerator
 
-from malcolm.core import Process
+from malcolm.core import Process, TimeoutError
 from malcolm.modules.builtin.blocks import proxy_block
+from malcolm.modules.builtin.controllers import ProxyController
 from malcolm.modules.builtin.util import ExportTable
 from malcolm.modules.demo.blocks import ticker_block
 from malcolm.modules.pva.blocks import pva_client_block, pva_server_block
@@ -46,6 +48,40 @@ class TestSystemPVA(unittest.TestCase):
     def test_init(self):
         self.check_blocks_equal()
 
+    def test_proxy_fields(self):
+        process3 = Process("proc3")
+        for controller in \
+                pva_client_block(mri="PVA-CLIENT3") + \
+                proxy_block(mri="TICKER", comms="PVA-CLIENT3",
+                            use_cothread=True,
+                            fields=["state", "totalSteps", "reset"]):
+            process3.add_controller(controller)
+        process3.start()
+        self.addCleanup(process3.stop, timeout=2)
+        block = process3.block_view("TICKER")
+        fields = ["meta", "health", "state", "totalSteps", "reset"]
+        assert list(block) == fields
+        assert block.meta.fields == fields[1:]
+        assert block.state.value == "Ready"
+        # Changes to the fields we have still come through
+        self.process.block_view("TICKER").configure(
+            self.make_generator(), axesToMove=["x", "y"])
+        block.when_value_matches("totalSteps", 6, timeout=2)
+        block.reset()
+        block.when_value_matches("state", "Ready", timeout=2)
+        assert list(block) == fields
+
+    @patch("malcolm.modules.builtin.controllers.clientcomms.DEFAULT_TIMEOUT",
+           0.5)
+    def test_sync_proxy_reports_missing(self):
+        client = self.process2.get_controller("PVA-CLIENT")
+        proxy = ProxyController("MISSING", "PVA-CLIENT")
+        proxy.add_initial_part_fields()
+        with self.assertRaises(TimeoutError) as cm:
+            client.sync_proxy("MISSING", proxy._block)
+        assert str(cm.exception) == \
+            "Timeout waiting for MISSING to sync after 0.5s"
+
     def test_validate(self):
         block = self.process2.block_view("TICKER")
         generator = self.make_generator()
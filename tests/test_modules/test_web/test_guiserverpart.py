@@ -0,0 +1,82 @@
+import gzip
+import mimetypes
+import os
+from io import BytesIO
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from malcolm.modules.web.parts import GuiServerPart
+from malcolm.modules.web.parts.guiserverpart import www_dir, accepts_gzip
+
+
+class TestGuiServerPart(AsyncHTTPTestCase):
+    def get_app(self):
+        self.o = GuiServerPart()
+        handlers = [(info.regexp, info.request_class, info.kwargs)
+                    for info in self.o.report_handlers()]
+        return Application(handlers)
+
+    def get(self, path, gzip=True):
+        headers = {}
+        if gzip:
+            headers["Accept-Encoding"] = "gzip"
+        return self.fetch(path, headers=headers, decompress_response=False)
+
+    def read(self, path):
+        with open(os.path.join(www_dir, path), "rb") as f:
+            return f.read()
+
+    def test_hashed_file_gzipped_and_immutable(self):
+        response = self.get("/static/js/main.2f20520f.js")
+        assert response.code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Content-Type"] == \
+            mimetypes.guess_type("main.js")[0]
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert "immutable" in response.headers["Cache-Control"]
+        body = gzip.GzipFile(fileobj=BytesIO(response.body)).read()
+        assert body == self.read("static/js/main.2f20520f.js")
+
+    def test_uncompressed_if_not_accepted(self):
+        response = self.get("/static/js/main.2f20520f.js", gzip=False)
+        assert response.code == 200
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.body == self.read("static/js/main.2f20520f.js")
+
+    def test_gzip_refused(self):
+        for accept_encoding in ("gzip;q=0", "x-gzip", "deflate, gzip; q=0.0",
+                                "*;q=0", "identity"):
+            response = self.fetch(
+                "/static/js/main.2f20520f.js", decompress_response=False,
+                headers={"Accept-Encoding": accept_encoding})
+            assert "Content-Encoding" not in response.headers
+            assert response.body == self.read("static/js/main.2f20520f.js")
+
+    def test_accepts_gzip(self):
+        assert accepts_gzip("gzip")
+        assert accepts_gzip("deflate, GZIP;q=0.5")
+        assert accepts_gzip("*")
+        assert accepts_gzip("br;q=1.0, *;q=0.1")
+        assert not accepts_gzip("")
+        assert not accepts_gzip("gzip;q=0, *")
+        assert not accepts_gzip("x-gzip")
+
+    def test_unhashed_files_revalidated(self):
+        for path in ("/gui/", "/service-worker.js"):
+            response = self.get(path)
+            assert response.code == 200
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert response.headers["Cache-Control"] == "no-cache"
+            response = self.fetch(path, headers={
+                "Accept-Encoding": "gzip",
+                "If-None-Match": response.headers["Etag"]})
+            assert response.code == 304
+
+    def test_already_compressed_files_not_gzipped(self):
+        path = "static/media/roboto-latin-400.5d4aeb4e.woff2"
+        response = self.get("/" + path)
+        assert "Content-Encoding" not in response.headers
+        assert "immutable" in response.headers["Cache-Control"]
+        assert response.body == self.read(path)
@@ -0,0 +1,195 @@
+import time
+import unittest
+
+from mock import ANY
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+from malcolm.compat import sleep
+from malcolm.core import Process, Queue, json_decode, json_encode
+from malcolm.modules.demo.blocks import counter_block, hello_block
+from malcolm.modules.web.blocks import web_server_block
+
+
+class TestRestfulServerPart(unittest.TestCase):
+    socket = 8884
+
+    def setUp(self):
+        self.process = Process("proc")
+        self.counter = counter_block(mri="counter")[-1]
+        self.process.add_controller(self.counter)
+        self.process.add_controller(hello_block(mri="hello")[-1])
+        self.server = web_server_block(mri="server", port=self.socket)[-1]
+        self.process.add_controller(self.server)
+        self.result = Queue()
+        self.process.start()
+
+    def tearDown(self):
+        self.process.stop(timeout=1)
+
+    @gen.coroutine
+    def fetch(self, path, etag=None, body=None):
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        client = AsyncHTTPClient()
+        try:
+            response = yield client.fetch(
+                "http://localhost:%d/rest/%s" % (self.socket, path),
+                headers=headers, method="GET" if body is None else "POST",
+                body=body)
+        except HTTPError as e:
+            response = e.response
+        self.result.put(response)
+
+    def get(self, path, etag=None, body=None):
+        self.server._loop.add_callback(self.fetch, path, etag, body)
+        return self.result.get(timeout=2)
+
+    def test_conditional_get(self):
+        response = self.get("counter/counter")
+        assert response.code == 200
+        assert json_decode(response.body)["value"] == 0
+        etag = response.headers["Etag"]
+        # Unchanged, so nothing is sent
+        response = self.get("counter/counter", etag)
+        assert response.code == 304
+        assert response.body == b""
+        # Changing something else in the Block doesn't affect the Attribute
+        self.counter.health.set_value("Changed")
+        assert self.get("counter/counter", etag).code == 304
+        # But does change the ETag of the whole Block
+        response = self.get("counter")
+        block_etag = response.headers["Etag"]
+        assert self.get("counter", block_etag).code == 304
+        self.counter.parts["counter"].counter.set_value(5)
+        response = self.get("counter/counter", etag)
+        assert response.code == 200
+        assert json_decode(response.body)["value"] == 5
+        assert response.headers["Etag"] != etag
+        assert self.get("counter", block_etag).code == 200
+
+    def test_batch_post(self):
+        body = json_encode([
+            "counter/counter/value",
+            "hello/greet/description",
+            {"path": "hello/greet", "parameters": {"name": "me"}},
+            "missing/attr",
+            "counter/missing",
+        ])
+        response = self.get("", body=body)
+        assert response.code == 200
+        results = json_decode(response.body)
+        assert list(results) == [
+            "counter/counter/value", "hello/greet/description",
+            "hello/greet", "missing/attr", "counter/missing"]
+        assert results["counter/counter/value"] == 0
+        assert results["hello/greet/description"].startswith("Optionally")
+        assert results["hello/greet"] == "Hello me"
+        for path in ("missing/attr", "counter/missing"):
+            assert results[path]["typeid"] == "malcolm:core/Error:1.0"
+
+    def test_batch_get(self):
+        response = self.get(
+            "?path=counter/counter/value&path=hello/greet/description")
+        assert response.code == 200
+        assert list(json_decode(response.body)) == [
+            "counter/counter/value", "hello/greet/description"]
+
+    def test_batch_bad_body(self):
+        assert self.get("", body="{").code == 400
+
+    def test_batch_bad_items(self):
+        for items in ([1], [{"parameters": {}}], [{"path": "hello/greet",
+                                                   "parameters": []}]):
+            assert self.get("", body=json_encode(items)).code == 400
+
+    def test_batch_duplicate_paths(self):
+        body = json_encode([
+            {"path": "counter/increment"}, {"path": "counter/increment"}])
+        assert self.get("", body=body).code == 400
+        # Nothing was run
+        assert self.counter.parts["counter"].counter.value == 0
+        response = self.get(
+            "?path=counter/counter/value&path=counter/counter/value")
+        assert response.code == 400
+
+    @gen.coroutine
+    def stream(self, path):
+        self.events = yield TCPClient().connect("localhost", self.socket)
+        yield self.events.write(
+            b"GET /rest_events/%s HTTP/1.1\r\nHost: localhost\r\n\r\n"
+            % path.encode())
+        while True:
+            try:
+                data = yield self.events.read_bytes(4096, partial=True)
+            except StreamClosedError:
+                break
+            self.result.put(data)
+
+    def open_stream(self, path):
+        self.server._loop.add_callback(self.stream, path)
+        self.data = b""
+        headers = self.read_data(b"\r\n\r\n")
+        assert b"Content-Type: text/event-stream" in headers
+
+    def close_stream(self):
+        self.server._loop.add_callback(self.events.close)
+
+    def read_data(self, text):
+        while text not in self.data:
+            self.data += self.result.get(timeout=2)
+        before, self.data = self.data.split(text, 1)
+        return before + text
+
+    def read_events(self, n):
+        events = []
+        for _ in range(n):
+            line = self.read_data(b"\n\n").splitlines()[-2]
+            assert line.startswith(b"data: ")
+            events.append(json_decode(
+                '{"changes": %s}' % line[6:].decode())["changes"])
+        return events
+
+    def test_event_stream(self):
+        self.open_stream("counter/counter")
+        events = self.read_events(1)
+        assert events[0][0][0] == []
+        assert events[0][0][1]["value"] == 0
+        self.counter.parts["counter"].counter.set_value(3)
+        events = self.read_events(1)
+        assert events == [[[["value"], 3], [["timeStamp"], ANY]]]
+        notifier = self.counter._notifier
+        assert len(notifier._subscription_keys) == 1
+        # Disconnecting should unsubscribe
+        self.close_stream()
+        for _ in range(20):
+            if not notifier._subscription_keys:
+                break
+            sleep(0.1)
+        assert notifier._subscription_keys == {}
+
+    def test_event_stream_max_rate(self):
+        self.open_stream("counter/counter/value?max_rate=2")
+        assert self.read_events(1) == [[[[], 0]]]
+        start = time.time()
+        for i in range(1, 6):
+            self.counter.parts["counter"].counter.set_value(i)
+        # All squashed into one event sent half a second after the first
+        assert self.read_events(1) == [[[[], 5]]]
+        assert time.time() - start > 0.3
+        self.close_stream()
+
+    def test_event_stream_bad_max_rate(self):
+        self.server._loop.add_callback(
+            self.stream, "counter/counter?max_rate=abc")
+        self.data = b""
+        headers = self.read_data(b"\r\n\r\n")
+        assert headers.startswith(b"HTTP/1.1 400 ")
+        self.close_stream()
+
+    def test_event_stream_error(self):
+        self.open_stream("missing/attr")
+        self.read_data(b"event: error")
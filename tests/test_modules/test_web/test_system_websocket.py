@@ -5,7 +5,8 @@ from tornado.websocket import websocket_connect
 from tornado import gen
 
 from malcolm.compat import OrderedDict
-from malcolm.core import Process, Queue, ResponseError, Post, json_encode
+from malcolm.core import Process, Queue, ResponseError, Post, json_encode, \
+    Subscribe, TimeoutError, Delta
 from malcolm.modules.builtin.blocks import proxy_block
 from malcolm.modules.demo.blocks import hello_block, counter_block
 from malcolm.modules.web.blocks import web_server_block, websocket_client_block
@@ -282,3 +283,88 @@ class TestSystemWSCommsServerAndClient(unittest.TestCase):
         assert block2.counter.value == 0
         assert self.process2.block_view("client").remoteBlocks.value == [
             "hello", "counter", "server"]
+
+    def test_server_counter_pipelined_puts(self):
+        block1 = self.process.block_view("counter")
+        block2 = self.process2.block_view("counter")
+        counter2 = block2.counter
+        # All Puts are in flight at once, and are done in order on the server
+        futures = [counter2.put_value_async(i) for i in range(1, 11)]
+        block2.wait_all_futures(futures, timeout=2)
+        assert block1.counter.value == 10
+        block2.put_attribute_values(dict(counter=32))
+        assert block1.counter.value == 32
+        with self.assertRaises(ResponseError):
+            self.process2.block_view("hello").error()
+
+    def test_proxy_fields(self):
+        process3 = Process("proc3")
+        for controller in \
+                websocket_client_block(mri="client3", port=self.socket) \
+                + proxy_block(mri="counter", comms="client3",
+                              fields=["counter", "increment"]):
+            process3.add_controller(controller)
+        process3.start()
+        self.addCleanup(process3.stop, timeout=1)
+        block3 = process3.block_view("counter")
+        assert list(block3) == ["meta", "health", "counter", "increment"]
+        assert block3.meta.fields == ["health", "counter", "increment"]
+        block3.increment()
+        assert block3.counter.value == 1
+        assert list(block3) == ["meta", "health", "counter", "increment"]
+
+    def test_reconnect_resyncs_proxies(self):
+        client = self.process2.get_controller("client")
+        proxy = self.process2.get_controller("counter")
+        counter = proxy._block.counter
+        q = Queue()
+        subscribe = Subscribe(path=["counter"], delta=True)
+        subscribe.set_callback(q.put)
+        proxy.handle_request(subscribe)
+        assert q.get(timeout=1).changes[0][0] == []
+        # Drop the connection, and change the server while we reconnect
+        client.loop.add_callback(client._conn.close)
+        self.process.block_view("counter").increment()
+        block2 = self.process2.block_view("counter")
+        block2.when_value_matches("counter", 1, timeout=5)
+        block2.when_value_matches("health", "OK", timeout=5)
+        # The proxy Block has been updated rather than rebuilt
+        assert proxy._block.counter is counter
+        changes = []
+        try:
+            while True:
+                changes += q.get(timeout=0.1).changes
+        except TimeoutError:
+            pass
+        assert changes
+        assert [] not in [change[0] for change in changes]
+        assert self.process2.block_view("client").health.value == "OK"
+        # And we can still use it
+        block2.increment()
+        assert self.process.block_view("counter").counter.value == 2
+
+    def test_batched_deltas_squashed(self):
+        client = self.process2.get_controller("client")
+        proxy = self.process2.get_controller("counter")
+        q = Queue()
+        subscribe = Subscribe(path=["counter"], delta=True)
+        subscribe.set_callback(q.put)
+        proxy.handle_request(subscribe)
+        assert q.get(timeout=1).changes[0][0] == []
+        # A batch of Deltas is applied to the proxy as a single change
+        client._apply_responses("counter", [
+            Delta(changes=[[["counter", "value"], 3]]),
+            Delta(changes=[[["counter", "value"], 4]]),
+        ])
+        response = q.get(timeout=1)
+        assert response.changes == [
+            [["counter", "value"], 3], [["counter", "value"], 4]]
+        assert proxy._block.counter.value == 4
+        with self.assertRaises(TimeoutError):
+            q.get(timeout=0.1)
+
+    def test_initial_snapshots_compressed(self):
+        server = self.process.block_view("server")
+        # Block snapshots are repetitive JSON so compress well
+        assert server.compressionRatio.value > 3
+        assert server.compressionTime.value > 0
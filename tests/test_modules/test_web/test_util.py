@@ -0,0 +1,127 @@
+import threading
+import time
+import unittest
+
+from mock import MagicMock
+from tornado.ioloop import IOLoop
+
+from malcolm.core import Queue
+from malcolm.modules.web.util import CompressionStats, compression_options, \
+    OrderedWorkers, merge_changes
+
+
+class TestMergeChanges(unittest.TestCase):
+    def test_overwritten_changes_dropped(self):
+        old = [[["a", "value"], 1], [["a", "timeStamp"], 2], [["b"], 3]]
+        new = [[["a"], 4], [["b", "value"], 5]]
+        assert merge_changes(old, new) == [
+            [["b"], 3], [["a"], 4], [["b", "value"], 5]]
+
+    def test_root_change_drops_all(self):
+        old = [[["a", "value"], 1], [["b"]]]
+        new = [[[], dict(a=2)]]
+        assert merge_changes(old, new) == new
+
+
+class TestCompressionStats(unittest.TestCase):
+    def setUp(self):
+        self.o = CompressionStats(threshold=10)
+        self.protocol = MagicMock(_wire_bytes_out=0)
+        self.compressor = self.protocol._compressor
+
+        def write_message(message):
+            self.compressed.append(self.protocol._compressor is not None)
+            if self.protocol._compressor:
+                self.protocol._wire_bytes_out += len(message) // 4
+            else:
+                self.protocol._wire_bytes_out += len(message)
+
+        self.compressed = []
+        self.protocol.write_message.side_effect = write_message
+
+    def test_compression_options(self):
+        assert compression_options(0) is None
+        assert compression_options(3) == dict(compression_level=3)
+
+    def test_threshold(self):
+        self.o.write_message(self.protocol, "short")
+        self.o.write_message(self.protocol, "x" * 40)
+        assert self.compressed == [False, True]
+        assert self.protocol._compressor is self.compressor
+        assert self.o.ratio.value == 4.0
+        assert self.o.time.value >= 0
+
+    def test_bytes_counted(self):
+        # 4 characters, but 12 bytes once encoded
+        self.o.write_message(self.protocol, u"\u20ac" * 4)
+        self.o.write_message(self.protocol, u"\u20ac" * 40)
+        assert self.compressed == [True, True]
+        self.o.publish()
+        assert self.o.ratio.value == 4.0
+        self.protocol.write_message.assert_called_with(
+            u"\u20ac".encode("utf-8") * 40)
+
+    def test_compressor_restored_on_error(self):
+        self.protocol.write_message.side_effect = ValueError("Closed")
+        with self.assertRaises(ValueError):
+            self.o.write_message(self.protocol, "short")
+        assert self.protocol._compressor is self.compressor
+
+    def test_unknown_protocol(self):
+        # Doesn't have the tornado 4.5 private attributes
+        protocol = MagicMock(spec=["write_message"])
+        self.o.write_message(protocol, "x" * 40)
+        protocol.write_message.assert_called_once_with("x" * 40)
+        assert self.o.ratio.value == 1.0
+        assert self.o.time.value == 0
+
+    def test_not_negotiated(self):
+        self.protocol._compressor = None
+        self.o.write_message(self.protocol, "x" * 40)
+        assert self.compressed == [False]
+        assert self.o.ratio.value == 1.0
+
+
+class TestOrderedWorkers(unittest.TestCase):
+    def setUp(self):
+        self.loop = IOLoop()
+        self.thread = threading.Thread(target=self.loop.start)
+        self.thread.start()
+        self.o = OrderedWorkers(4)
+        self.o.start(self.loop)
+        self.q = Queue()
+
+    def tearDown(self):
+        self.o.stop()
+        self.loop.add_callback(self.loop.stop)
+        self.thread.join()
+
+    def slow(self, key, i):
+        # Later jobs are faster, so would overtake if not kept in order
+        time.sleep(0.01 * (5 - i))
+        return key, i
+
+    def test_order_kept_per_key(self):
+        def submit():
+            for i in range(5):
+                for key in "ab":
+                    self.o.run(key, self.q.put, self.slow, key, i)
+        self.loop.add_callback(submit)
+        results = [self.q.get(timeout=1) for _ in range(10)]
+        for key in "ab":
+            assert [i for k, i in results if k == key] == list(range(5))
+
+    def test_error_passed_to_callback(self):
+        def fail():
+            raise ValueError("Bad")
+        self.loop.add_callback(self.o.run, "a", self.q.put, fail)
+        self.loop.add_callback(self.o.run, "a", self.q.put, self.slow, "a", 4)
+        error = self.q.get(timeout=1)
+        assert isinstance(error, ValueError)
+        assert self.q.get(timeout=1) == ("a", 4)
+
+    def test_no_workers_runs_inline(self):
+        o = OrderedWorkers(0)
+        o.start(MagicMock())
+        o.run("a", self.q.put, self.slow, "a", 4)
+        assert self.q.get(timeout=0) == ("a", 4)
@@ -1,7 +1,11 @@
 import unittest
 
+from mock import MagicMock
+
 from malcolm.modules.web.controllers import WebsocketClientComms
-from malcolm.core import Process
+from malcolm.core import Process, Post, Put, Subscribe, Error, Return, \
+    ResponseError, json_decode, Delta, BlockModel, NumberMeta, \
+    serialize_object
 
 
 class TestWebsocketClientComms(unittest.TestCase):
@@ -9,9 +13,94 @@ class TestWebsocketClientComms(unittest.TestCase):
     def setUp(self):
         self.process = Process("proc")
         self.o = WebsocketClientComms(mri="mri")
+        self.o.loop = MagicMock()
+        self.o.loop.add_callback.side_effect = lambda f, *args: f(*args)
+        self.sent = []
+        self.o.compression_stats = MagicMock()
+        self.o.compression_stats.write_message.side_effect = \
+            lambda protocol, message: self.sent.append(json_decode(message))
 
     def test_init(self):
         assert self.o.hostname == "localhost"
         assert self.o.port == 8080
         assert self.o.connect_timeout == 10.0
         assert self.o.mri == "mri"
+
+    def test_requests_fail_while_disconnected(self):
+        responses = []
+        post = Post(path=["b", "method"])
+        post.set_callback(responses.append)
+        self.o._send_request(post)
+        assert self.sent == []
+        assert isinstance(responses[0], Error)
+        assert isinstance(responses[0].message, ResponseError)
+        # Subscribes wait to be sent on connect
+        self.o._add_subscription(Subscribe(path=["b"]))
+        assert self.sent == []
+        self.o._conn = MagicMock()
+        self.o._on_connect()
+        assert [d["typeid"] for d in self.sent] == [
+            "malcolm:core/Subscribe:1.0"]
+
+    def test_in_flight_requests_failed_on_connect(self):
+        self.o._conn = MagicMock()
+        responses = []
+        post = Post(path=["b", "method"])
+        post.set_callback(responses.append)
+        self.o._send_request(post)
+        assert len(self.sent) == 1
+        # We never saw the disconnect, but the connection is new
+        self.o._on_connect()
+        assert isinstance(responses[0], Error)
+        assert self.o._request_lookup == {}
+
+    def test_resubscribe_replaces(self):
+        self.o._conn = MagicMock()
+        first = Subscribe(path=["b"], delta=True)
+        first.set_callback(MagicMock())
+        self.o._add_subscription(first)
+        second = Subscribe(path=["b"], delta=True)
+        second.set_callback(MagicMock())
+        self.o._add_subscription(second)
+        # The first is unsubscribed, and only the second is resent
+        assert [(d["typeid"], d["id"]) for d in self.sent] == [
+            ("malcolm:core/Subscribe:1.0", first.id),
+            ("malcolm:core/Unsubscribe:1.0", first.id),
+            ("malcolm:core/Subscribe:1.0", second.id)]
+        assert list(self.o._subscriptions.values()) == [second]
+        self.o.on_message('{"typeid": "malcolm:core/Return:1.0", "id": %d}'
+                          % first.id)
+        first.callback.assert_called_once()
+        assert isinstance(first.callback.call_args[0][0], Return)
+
+    def test_deferred_returns_sent_when_stopped(self):
+        self.o._conn = MagicMock()
+        # A worker is busy applying a batch to proxy b
+        self.o.spawn = MagicMock()
+        self.o._queue_response("b", Delta(changes=[]))
+        assert self.o._applying == {"b"}
+        responses = []
+        put = Put(path=["b", "attr", "value"], value=1)
+        put.set_callback(responses.append)
+        self.o._send_request(put)
+        self.o.on_message('{"typeid": "malcolm:core/Return:1.0", "id": %d}'
+                          % put.id)
+        # Held back until the batch is applied
+        assert responses == []
+        self.o._queue_response("b", Delta(changes=[]))
+        # Disconnect before the worker finishes
+        self.o._spawned = MagicMock()
+        self.o.stop_io_loop()
+        assert len(responses) == 1
+        assert isinstance(responses[0], Return)
+        assert self.o._pending_responses == {}
+
+    def test_endpoint_added_and_removed(self):
+        block = BlockModel()
+        attr = NumberMeta("int32").create_attribute_model(3)
+        self.o._handle_response(block, Delta(
+            changes=[[["attr"], serialize_object(attr)]]))
+        assert "attr" in block
+        assert block.attr.value == 3
+        self.o._handle_response(block, Delta(changes=[[["attr"]]]))
+        assert "attr" not in block
@@ -0,0 +1,156 @@
+import unittest
+
+from mock import MagicMock
+
+from malcolm.compat import OrderedDict
+from malcolm.core import Delta, Update, Return, json_encode, json_decode, \
+    AlarmSeverity, Subscribe, Unsubscribe
+from malcolm.modules.builtin.infos import HealthInfo, RequestInfo
+from malcolm.modules.web.parts import WebsocketServerPart
+from malcolm.modules.web.parts.websocketserverpart import \
+    MalcWebSocketHandler, MAX_ENCODING
+
+
+class TestWebsocketServerPart(unittest.TestCase):
+    def setUp(self):
+        self.o = WebsocketServerPart(high_water_mark=100)
+        self.o.registrar = MagicMock()
+        self.futures = []
+        self.sent = []
+        # Make a handler without a tornado application behind it
+        self.handler = MalcWebSocketHandler.__new__(MalcWebSocketHandler)
+        self.handler.initialize(self.o, MagicMock(), self.o.high_water_mark)
+        self.handler.write_message = self.write_message
+        self.o._loop = MagicMock()
+        self.o._loop.add_callback.side_effect = lambda f, *args: f(*args)
+
+    def write_message(self, message):
+        self.sent.append(message)
+        future = MagicMock()
+        self.futures.append(future)
+        return future
+
+    def flush(self):
+        while self.futures:
+            future = self.futures.pop(0)
+            callback = future.add_done_callback.call_args[0][0]
+            callback(future)
+
+    def test_writes_below_high_water_mark(self):
+        response = Update(1, "x")
+        self.o.on_response(response, self.handler)
+        assert self.sent == [json_encode(response)]
+        self.o.registrar.report.assert_not_called()
+
+    def test_coalesces_when_stalled(self):
+        big = Delta(1, [[[], "x" * 200]])
+        self.o.on_response(big, self.handler)
+        assert len(self.sent) == 1
+        # Client isn't keeping up, so these get merged together
+        self.o.on_response(Delta(1, [[["a", "value"], 1]]), self.handler)
+        self.o.on_response(Update(2, "first"), self.handler)
+        self.o.on_response(Delta(1, [[["a", "value"], 2]]), self.handler)
+        self.o.on_response(Delta(1, [[["b", "value"], 3]]), self.handler)
+        self.o.on_response(Update(2, "second"), self.handler)
+        self.o.on_response(Return(2), self.handler)
+        assert len(self.sent) == 1
+        info = self.o.registrar.report.call_args[0][0]
+        assert isinstance(info, HealthInfo)
+        assert info.alarm.severity == AlarmSeverity.MINOR_ALARM
+        # Now let the buffer drain
+        self.flush()
+        assert self.sent[1:] == [
+            json_encode(Delta(1, [[["a", "value"], 2], [["b", "value"], 3]])),
+            json_encode(Update(2, "second")),
+            json_encode(Return(2)),
+        ]
+        info = self.o.registrar.report.call_args[0][0]
+        assert info.alarm.is_ok()
+        assert self.o._stalled == set()
+
+    def test_encoding_counts_towards_high_water_mark(self):
+        # Hold on to the encodes as if the workers were busy
+        encodes = []
+        self.o.workers = MagicMock()
+        self.o.workers.run.side_effect = \
+            lambda key, callback, func: encodes.append((callback, func))
+        for i in range(MAX_ENCODING + 5):
+            self.o.on_response(Update(1, i), self.handler)
+        # Only MAX_ENCODING were given to the workers, the rest were merged
+        assert len(encodes) == MAX_ENCODING
+        assert list(self.handler._queue) == [1]
+        info = self.o.registrar.report.call_args[0][0]
+        assert info.alarm.severity == AlarmSeverity.MINOR_ALARM
+        # When the encodes finish the latest value is sent
+        while encodes:
+            callback, func = encodes.pop(0)
+            callback(func())
+        self.flush()
+        assert json_decode(self.sent[-1])["value"] == MAX_ENCODING + 4
+        assert len(self.sent) == MAX_ENCODING + 1
+        info = self.o.registrar.report.call_args[0][0]
+        assert info.alarm.is_ok()
+
+    def test_encode_error_sent_to_client(self):
+        class Unencodable(object):
+            pass
+
+        self.o.on_response(Return(3, Unencodable()), self.handler)
+        d = json_decode(self.sent[0])
+        assert d["typeid"] == "malcolm:core/Error:1.0"
+        assert d["id"] == 3
+
+    def make_handler(self):
+        handler = MalcWebSocketHandler.__new__(MalcWebSocketHandler)
+        handler.initialize(self.o, self.o._loop, self.o.high_water_mark)
+        handler.write_message = self.write_message
+        return handler
+
+    def subscribe(self, handler, id):
+        request = Subscribe(id, ["b", "attr"], delta=True)
+        request.set_callback(handler.on_response)
+        self.o.on_request(request, handler)
+
+    def test_shared_subscription(self):
+        self.o.high_water_mark = 1000
+        h1, h2 = self.make_handler(), self.make_handler()
+        self.subscribe(h1, 3)
+        self.subscribe(h2, 8)
+        # Only one subscription is made to the Block
+        assert self.o.registrar.report.call_count == 1
+        upstream = self.o.registrar.report.call_args[0][0].request
+        assert upstream.path == ["b", "attr"]
+        # Initial value and a change go to both clients with their own ids
+        upstream.callback(Delta(upstream.id, [[[], OrderedDict([("value", 1)])]]))
+        upstream.callback(Delta(upstream.id, [[["value"], 2]]))
+        assert [json_decode(m) for m in self.sent] == [
+            dict(typeid="malcolm:core/Delta:1.0", id=3,
+                 changes=[[[], dict(value=1)]]),
+            dict(typeid="malcolm:core/Delta:1.0", id=8,
+                 changes=[[[], dict(value=1)]]),
+            dict(typeid="malcolm:core/Delta:1.0", id=3,
+                 changes=[[["value"], 2]]),
+            dict(typeid="malcolm:core/Delta:1.0", id=8,
+                 changes=[[["value"], 2]]),
+        ]
+        # A late joiner gets the current state
+        h3 = self.make_handler()
+        self.subscribe(h3, 1)
+        assert json_decode(self.sent[-1]) == dict(
+            typeid="malcolm:core/Delta:1.0", id=1,
+            changes=[[[], dict(value=2)]])
+        # Unsubscribe only goes to the Block when the last client leaves
+        for handler, id in ((h1, 3), (h2, 8)):
+            unsubscribe = Unsubscribe(id)
+            unsubscribe.set_callback(handler.on_response)
+            self.o.on_request(unsubscribe, handler)
+        assert json_decode(self.sent[-1]) == dict(
+            typeid="malcolm:core/Return:1.0", id=8, value=None)
+        assert self.o.registrar.report.call_count == 1
+        self.o.on_close(h3)
+        info = self.o.registrar.report.call_args[0][0]
+        assert isinstance(info, RequestInfo)
+        assert isinstance(info.request, Unsubscribe)
+        assert info.request.id == upstream.id
+        assert self.o._shared == {}
+        assert self.o._subscription_keys == {}